@@ -0,0 +1,329 @@
+import os
+import yaml
+import duckdb
+import pandas as pd
+import streamlit as st
+from data_ingest import DATA_DIR, config_leagues, league_dir
+from data_pipeline import data_pipeline
+from stat_cube import StatCube
+
+# The pages show one league, DRAFTY_LEAGUE or the first one in config.yaml
+with open("drafty/config.yaml", "r") as config_file:
+    CONFIG = yaml.safe_load(config_file)
+LEAGUE_CODE = os.environ.get("DRAFTY_LEAGUE", str(config_leagues(CONFIG)[0]))
+LEAGUE_DIR = league_dir(LEAGUE_CODE)
+DATABASE = f"{LEAGUE_DIR}/drafty.db"
+GW_FILE = f"{LEAGUE_DIR}/data_gw"
+TEAMS_FILE = f"{LEAGUE_DIR}/data_teams"
+CUBE_DIR = f"{LEAGUE_DIR}/stat_cube"
+
+# Raw files tracked in git that the database is built from
+RAW_FILES = [
+    f"{LEAGUE_DIR}/details.json",
+    f"{LEAGUE_DIR}/transactions.json",
+    f"{DATA_DIR}/store/index.json",
+]
+
+# Display names of the transfer table columns
+TRANSFER_COLUMNS = {
+    "team": "Team Name",
+    "waiver_or_free": "Type",
+    "waiver_gw": "Transfer GW",
+    "next_gw": "From GW",
+    "last_gw": "Last GW",
+    "player_in": "IN",
+    "player_in_pts": "IN Pts",
+    "player_out": "OUT",
+    "player_out_pts": "OUT Pts",
+    "net_pts": "Net Points",
+}
+
+# Transfer leaderboards, mapped to their table in the database
+LEADERBOARDS = {
+    "top_by_team": "top_n_transfers_by_team",
+    "bottom_by_team": "bottom_n_transfers_by_team",
+    "top_by_kind": "top_n_transfers_by_kind",
+    "bottom_by_kind": "bottom_n_transfers_by_kind",
+}
+
+# Sort options of the bench detail table, mapped to their column
+BENCH_SORT_COLUMNS = {
+    "pts_lost": "pts_lost",
+    "player_type": "player_type",
+    "team": "name",
+}
+
+
+@st.cache_resource(max_entries=1, show_spinner="Building the league database")
+def build_database(raw_mtime):
+    """
+    Build the database and stat cube of the league from the raw files, once
+    per process and raw files mtime. Neither is tracked in git, so a
+    deployment from git starts without them, and a pull of newer raw files
+    leaves them behind.
+    """
+    if (
+        os.path.exists(DATABASE)
+        and os.path.getmtime(DATABASE) >= raw_mtime
+        and os.path.exists(f"{CUBE_DIR}/current")
+    ):
+        return
+    for path in [DATABASE, f"{DATABASE}.wal"]:
+        if os.path.exists(path):
+            os.remove(path)
+    data_pipeline(
+        refresh=False,
+        league_code=LEAGUE_CODE,
+        brackets=CONFIG.get("brackets"),
+        export=False,
+        top_n=CONFIG.get("top_n", 10),
+        transform_workers=CONFIG.get("transform_workers", 4),
+        transfer_horizons=CONFIG.get("transfer_horizons", [1, 3, 5]),
+    )
+
+
+def database_mtime():
+    """mtime of the league database, built first if it is missing or stale."""
+    build_database(max(os.path.getmtime(path) for path in RAW_FILES))
+    return os.path.getmtime(DATABASE)
+
+
+@st.cache_data(show_spinner=False)
+def read_query(sql, params, mtime):
+    # A connection per query rather than one held open: DuckDB lets no
+    # process write the file while another one has it open, so the pipeline
+    # can only refresh the database between queries
+    with duckdb.connect(DATABASE, read_only=True) as con:
+        return con.execute(sql, list(params)).df()
+
+
+def query(sql, params=()):
+    """
+    Run a parameterised query on the league database. Results are cached per
+    query, parameters and database mtime, so rerenders are memory lookups.
+    """
+    return read_query(sql, tuple(params), database_mtime())
+
+
+@st.cache_resource(max_entries=1)
+def stat_cube(version):
+    """
+    The stat cube of the league, memory mapped once per version. Slices of
+    it are views on the file, so player lookups copy no more than they read.
+    """
+    return StatCube.load(CUBE_DIR)
+
+
+def player_stat(players, stat="total_points"):
+    """A stat per gameweek of players, a {element id: name} dict, from the stat cube."""
+    database_mtime()
+    cube = stat_cube(StatCube.version(CUBE_DIR))
+    values = cube.stat(stat)[cube.rows(list(players))]
+    return pd.DataFrame(
+        values.T,
+        index=pd.RangeIndex(1, cube.gameweeks + 1, name="gw"),
+        columns=list(players.values()),
+    )
+
+
+@st.cache_data(show_spinner=False)
+def read_gw_teams(gw_mtime, teams_mtime):
+    # Read current gw, use as gw[0]
+    with open(GW_FILE, "r") as fp:
+        gw = fp.readlines()
+    # Read in team names
+    with open(TEAMS_FILE, "r") as fp:
+        teams = [i.strip() for i in fp.readlines()]
+
+    return gw[0], teams
+
+
+def load_current_gw_teams():
+    return read_gw_teams(os.path.getmtime(GW_FILE), os.path.getmtime(TEAMS_FILE))
+
+
+def load_bracket_dfs():
+    return tuple(
+        query(f"SELECT * FROM results_{bracket} ORDER BY points DESC")
+        for bracket in [1, 2, 3]
+    )
+
+
+def standings():
+    standings_ts = query(
+        """
+        SELECT name AS Name, gw AS Gameweek, -pos AS Position
+        FROM standings_ts
+        ORDER BY Gameweek, Name
+        """
+    )
+    cumm_points = query("SELECT * FROM cumm_points ORDER BY gw, name")
+
+    return standings_ts, cumm_points
+
+
+def horizons():
+    """Transfer horizons in transfer_horizons, mapped to their display name."""
+    df = query(
+        """
+        SELECT DISTINCT horizon
+        FROM transfer_horizons
+        ORDER BY horizon = 'held', TRY_CAST(horizon AS INTEGER)
+        """
+    )
+    return {
+        horizon: (
+            "Until dropped"
+            if horizon == "held"
+            else "1 GW" if horizon == "1" else f"{horizon} GWs"
+        )
+        for horizon in df["horizon"]
+    }
+
+
+def transactions(horizon="1", k=10):
+    """Best and worst k transfers over a horizon of transfer_horizons."""
+    boards = []
+    for order in ["DESC", "ASC"]:
+        df = query(
+            f"""
+            SELECT * EXCLUDE (gw, horizon, element_in, element_out, transaction_id)
+            FROM transfer_horizons
+            WHERE horizon = ? AND net_pts IS NOT NULL
+            ORDER BY net_pts {order}, waiver_gw, transaction_id
+            LIMIT ?
+            """,
+            [horizon, k],
+        )
+        boards.append(df.rename(columns=TRANSFER_COLUMNS))
+
+    return tuple(boards)
+
+
+def leaderboard_teams():
+    teams = query("SELECT DISTINCT team FROM top_n_transfers_by_team ORDER BY team")
+    return teams["team"].tolist()
+
+
+def leaderboard(board, team=None, kind=None):
+    """Rows of a transfer leaderboard, optionally for one team or kind only."""
+    df = query(
+        f"""
+        SELECT *
+        FROM {LEADERBOARDS[board]}
+        WHERE (? IS NULL OR team = ?) AND (? IS NULL OR waiver_or_free = ?)
+        ORDER BY rank
+        """,
+        [team, team, kind, kind],
+    )
+    return df.rename(columns=TRANSFER_COLUMNS)
+
+
+def gw_transfers(gw, horizon="1"):
+    df = query(
+        """
+        SELECT * EXCLUDE (gw, horizon, element_in, element_out, transaction_id)
+        FROM transfer_horizons
+        WHERE gw = ? AND horizon = ?
+        ORDER BY net_pts, transaction_id
+        """,
+        [int(gw), horizon],
+    )
+    return df.rename(columns=TRANSFER_COLUMNS)
+
+
+def gw_transfer_players(gw):
+    """Players moved in the transfers of gameweek gw, as {element id: name}."""
+    df = query(
+        """
+        SELECT DISTINCT element, name
+        FROM (
+            SELECT element_in AS element, player_in AS name
+            FROM transfer_horizons
+            WHERE gw = ?
+            UNION ALL
+            SELECT element_out, player_out
+            FROM transfer_horizons
+            WHERE gw = ?
+        )
+        ORDER BY name
+        """,
+        [int(gw), int(gw)],
+    )
+    return dict(zip(df["element"], df["name"]))
+
+
+def bench():
+    bench_pts = query("SELECT * FROM bench_pts ORDER BY name, pts_lost")
+    total_bench_pts = query("SELECT * FROM total_bench_pts ORDER BY bench_pts")
+
+    return bench_pts, total_bench_pts
+
+
+def bench_details(positions, sort_by):
+    """Bench points lost, filtered to positions (all if empty) and sorted descending."""
+    return query(
+        f"""
+        SELECT *
+        FROM bench_pts
+        WHERE len(?::VARCHAR[]) = 0 OR list_contains(?::VARCHAR[], player_type)
+        ORDER BY {BENCH_SORT_COLUMNS[sort_by]} DESC
+        """,
+        [list(positions), list(positions)],
+    )
+
+
+def lineup_points():
+    """Exact bench points and autosub gains per manager, after simulated autosubs."""
+    totals = query(
+        """
+        SELECT
+            b.player_first_name AS name,
+            SUM(l.bench_points)::BIGINT AS bench_points,
+            SUM(l.autosub_gain)::BIGINT AS autosub_gain
+        FROM lineup_points l
+            LEFT JOIN league_entries b
+            ON l.team_id = b.entry_id
+        GROUP BY 1
+        ORDER BY bench_points DESC
+        """
+    )
+    subs = query(
+        """
+        SELECT
+            a.gw,
+            b.player_first_name AS name,
+            po.web_name AS player_out,
+            pi.web_name AS player_in,
+            a.points_in
+        FROM autosubs a
+            LEFT JOIN league_entries b
+            ON a.team_id = b.entry_id
+            LEFT JOIN elements po
+            ON a.element_out = po.id
+            LEFT JOIN elements pi
+            ON a.element_in = pi.id
+        ORDER BY a.gw DESC, name
+        """
+    )
+    return totals, subs
+
+
+def selection_efficiency():
+    """Points scored against the hindsight optimal lineup, per manager."""
+    return query(
+        """
+        SELECT
+            b.player_first_name AS name,
+            SUM(o.points)::BIGINT AS points,
+            SUM(o.optimal_points)::BIGINT AS optimal_points,
+            SUM(o.gap)::BIGINT AS gap,
+            round(100 * SUM(o.points) / SUM(o.optimal_points), 1) AS efficiency,
+            count(*) FILTER (WHERE o.gap = 0) AS perfect_gws
+        FROM optimal_lineups o
+            LEFT JOIN league_entries b
+            ON o.team_id = b.entry_id
+        GROUP BY 1
+        ORDER BY efficiency DESC
+        """
+    )
@@ -1,53 +1,13 @@
 import streamlit as st
-import pandas as pd
 import plotly.express as px
-
-
-def load_current_gw_teams():
-    # Read current gw, use as gw[0]
-    with open(r"drafty/data_gw", "r") as fp:
-        gw = fp.readlines()
-    # Read in team names
-    with open(r"drafty/data_teams", "r") as fp:
-        t = fp.readlines()
-        teams = [i.strip() for i in t]
-
-    return gw[0], teams
-
-
-def transactions(col_names, int_cols):
-    top_n = pd.read_csv("drafty/data/top_df.csv")
-    bottom_n = pd.read_csv("drafty/data/bottom_df.csv")
-
-    top_n = top_n.rename(columns=col_names)
-    bottom_n = bottom_n.rename(columns=col_names)
-
-    top_n[int_cols] = top_n[int_cols].astype(int)
-    bottom_n[int_cols] = bottom_n[int_cols].astype(int)
-
-    return top_n, bottom_n
-
-
-def bench():
-    bench_pts = pd.read_csv("drafty/data/bench_pts.csv")
-    total_bench_pts = pd.read_csv("drafty/data/total_bench_pts.csv")
-
-    return bench_pts, total_bench_pts
-
-
-col_names = {
-    "team": "Team Name",
-    "waiver_or_free": "Type",
-    "waiver_gw": "Transfer GW",
-    "next_gw": "Next GW",
-    "player_in": "IN",
-    "player_in_pts": "IN Pts",
-    "player_out": "OUT",
-    "player_out_pts": "OUT Pts",
-    "net_pts": "Net Points",
-}
-
-int_cols = ["Transfer GW", "Next GW", "IN Pts", "OUT Pts", "Net Points"]
+from app_data import (
+    load_current_gw_teams,
+    bench,
+    bench_details,
+    lineup_points,
+    selection_efficiency,
+    BENCH_SORT_COLUMNS,
+)
 
 
 # Custom CSS for better styling
@@ -70,17 +30,22 @@ with st.expander("ℹ️ How to use this dashboard"):
     - Current Method of Calculation is to compare MIN pts per position (GK, DEF, MID, FWD) of starting 11 vs MAX pts per position on bench.
     - Only cases where the bench points were higher than starting are displayed as 'lost' points
     - It currently doesn't account for the edge case where two of the same position players are subbed in
+    - The Perfect XI tab compares the points scored with the best legal 11 from each week's squad, in hindsight
+    - The Autosubs tab replays the automatic substitutions with the formation rules and bench order, and shows the exact points left on the bench and gained from subs
     """
     )
 
 # Load data with spinner
 with st.spinner("Loading data..."):
     gw, teams = load_current_gw_teams()
-    top_n, bottom_n = transactions(col_names, int_cols)
     bench_pts, total_bench_pts = bench()
+    lineup_totals, autosubs = lineup_points()
+    efficiency = selection_efficiency()
 
 # Main tabs
-overview_tab, detail_tab = st.tabs(["Overview 📈", "Detailed Analysis 🔍"])
+overview_tab, detail_tab, autosub_tab, optimal_tab = st.tabs(
+    ["Overview 📈", "Detailed Analysis 🔍", "Autosubs 🔁", "Perfect XI 🎯"]
+)
 
 with overview_tab:
     # # Summary metrics remain the same
@@ -181,13 +146,10 @@ with detail_tab:
             "Filter by Position", options=bench_pts["player_type"].unique()
         )
     with col2:
-        sort_by = st.selectbox("Sort by", options=["pts_lost", "player_type", "team"])
+        sort_by = st.selectbox("Sort by", options=list(BENCH_SORT_COLUMNS))
 
-    # Filtered dataframe
-    filtered_df = bench_pts
-    if selected_positions:
-        filtered_df = filtered_df[filtered_df["player_type"].isin(selected_positions)]
-    filtered_df = filtered_df.sort_values(sort_by, ascending=False)
+    # Filtered and sorted in the database
+    filtered_df = bench_details(selected_positions, sort_by)
 
     # Display data with download option
     st.dataframe(
@@ -204,5 +166,44 @@ with detail_tab:
         key="download-bench",
     )
 
+with autosub_tab:
+    fig = px.bar(
+        lineup_totals,
+        x="name",
+        y=["bench_points", "autosub_gain"],
+        barmode="group",
+        title="Points Left on Bench and Gained from Autosubs",
+    )
+    fig.update_layout(
+        height=600,
+        template="plotly_dark",
+        xaxis_title="Team",
+        yaxis_title="Points",
+        legend_title="",
+    )
+    st.plotly_chart(fig, use_container_width=True)
+
+    st.dataframe(autosubs, hide_index=True, use_container_width=True)
+
+with optimal_tab:
+    fig = px.bar(
+        efficiency,
+        x="name",
+        y="efficiency",
+        color="efficiency",
+        text="efficiency",
+        title="Selection Efficiency (% of Optimal Points)",
+        color_continuous_scale=["red", "yellow", "green"],
+    )
+    fig.update_layout(
+        height=600,
+        template="plotly_dark",
+        xaxis_title="Team",
+        yaxis_title="Efficiency %",
+    )
+    st.plotly_chart(fig, use_container_width=True)
+
+    st.dataframe(efficiency, hide_index=True, use_container_width=True)
+
 # Footer
 st.caption("Updated as of GW: " + str(gw))
@@ -1,5 +1,6 @@
 import streamlit as st
 import pandas as pd
+from app_data import load_current_gw_teams, load_bracket_dfs, standings
 
 # Create the line chart with plotly for more customization
 import plotly.express as px
@@ -19,53 +20,6 @@ def update_team_totals(bracket_dfs, teams):
             st.session_state.team_totals[runner_up] += 25
 
 
-# @st.cache_data
-def load_current_gw_teams():
-    # Read current gw, use as gw[0]
-    with open(r"drafty/data_gw", "r") as fp:
-        gw = fp.readlines()
-    # Read in team names
-    with open(r"drafty/data_teams", "r") as fp:
-        t = fp.readlines()
-        teams = [i.strip() for i in t]
-
-    return gw[0], teams
-
-
-# @st.cache_data
-def load_bracket_dfs():
-    bracket_1 = pd.read_csv("drafty/data/results_1.csv")
-    bracket_1["points"] = bracket_1["points"].astype(int)
-    bracket_1 = bracket_1.sort_values(by="points", ascending=False)
-
-    bracket_2 = pd.read_csv("drafty/data/results_2.csv")
-    bracket_2["points"] = bracket_2["points"].astype(int)
-    bracket_2 = bracket_2.sort_values(by="points", ascending=False)
-
-    bracket_3 = pd.read_csv("drafty/data/results_3.csv")
-    bracket_3["points"] = bracket_3["points"].astype(int)
-    bracket_3 = bracket_3.sort_values(by="points", ascending=False)
-
-    return bracket_1, bracket_2, bracket_3
-
-
-# @st.cache_data
-def standings():
-    col_names = {
-        "gw": "Gameweek",
-        "pos": "Position",
-        "name": "Name",
-    }
-    standings_ts = pd.read_csv("drafty/data/standings_ts.csv")
-    standings_ts["pos"] = standings_ts["pos"] * -1
-    standings_ts = standings_ts.rename(columns=col_names)
-    standings_ts["Gameweek"] = standings_ts["Gameweek"].astype(int)
-
-    cumm_points = pd.read_csv("drafty/data/cumm_points.csv")
-
-    return standings_ts, cumm_points
-
-
 gw, teams = load_current_gw_teams()
 (bracket_1, bracket_2, bracket_3) = load_bracket_dfs()
 standings_ts, cumm_points = standings()
@@ -1,37 +1,14 @@
 import streamlit as st
-import pandas as pd
-
-
-def load_current_gw_teams():
-    # Read current gw, use as gw[0]
-    with open(r"drafty/data_gw", "r") as fp:
-        gw = fp.readlines()
-    # Read in team names
-    with open(r"drafty/data_teams", "r") as fp:
-        t = fp.readlines()
-        teams = [i.strip() for i in t]
-
-    return gw[0], teams
-
-
-def transactions(col_names, int_cols):
-    top_n = pd.read_csv("drafty/data/top_df.csv")
-    bottom_n = pd.read_csv("drafty/data/bottom_df.csv")
-
-    top_n = top_n.rename(columns=col_names)
-    bottom_n = bottom_n.rename(columns=col_names)
-
-    top_n[int_cols] = top_n[int_cols].astype(int)
-    bottom_n[int_cols] = bottom_n[int_cols].astype(int)
-
-    return top_n, bottom_n
-
-
-def bench():
-    bench_pts = pd.read_csv("drafty/data/bench_pts.csv")
-    total_bench_pts = pd.read_csv("drafty/data/total_bench_pts.csv")
-
-    return bench_pts, total_bench_pts
+from app_data import (
+    load_current_gw_teams,
+    horizons,
+    transactions,
+    leaderboard_teams,
+    leaderboard,
+    gw_transfers,
+    gw_transfer_players,
+    player_stat,
+)
 
 
 st.header("🔄 Transfer Analysis")
@@ -40,34 +17,30 @@ st.caption(
     "Track both successful moves and learning opportunities."
 )
 
-col_names = {
-    "team": "Team Name",
-    "waiver_or_free": "Type",
-    "waiver_gw": "Transfer GW",
-    "next_gw": "Next GW",
-    "player_in": "IN",
-    "player_in_pts": "IN Pts",
-    "player_out": "OUT",
-    "player_out_pts": "OUT Pts",
-    "net_pts": "Net Points",
-}
-
-int_cols = ["Transfer GW", "Next GW", "IN Pts", "OUT Pts", "Net Points"]
-
 gw, teams = load_current_gw_teams()
-top_n, bottom_n = transactions(col_names, int_cols)
-bench_pts, total_bench_pts = bench()
+
+# Transfers are valued over the chosen horizon, each one a filter on a
+# precomputed table
+horizon_names = horizons()
+horizon = st.radio(
+    "Points counted over",
+    list(horizon_names),
+    format_func=horizon_names.get,
+    horizontal=True,
+)
+top_n, bottom_n = transactions(horizon)
 
 # Space out the maps so the first one is 2x the size of the other three
 c1, c2, c3 = st.columns((0.05, 0.8, 0.05))
 
 
 # Create tabs with emojis and better labels
-blunders, smart_moves, transactions_gw = c2.tabs(
+blunders, smart_moves, transactions_gw, team_boards = c2.tabs(
     [
         "❌ Worst Transfers",
         "✅ Best Transfers",
         "📊 Transfer History",
+        "🏅 Leaderboards",
     ]
 )
 
@@ -165,12 +138,7 @@ with transactions_gw:
                 format_func=lambda x: f"Gameweek {x}",
             )
 
-    # ...existing code for blunders_df processing...
-    blunders_df = pd.read_csv(f"drafty/data/blunders_{option}.csv")
-    blunders_df_sorted = blunders_df.sort_values(by="net_pts", ascending=True)
-    blunders_df_sorted = blunders_df_sorted.rename(columns=col_names)
-
-    blunders_df_sorted[int_cols] = blunders_df_sorted[int_cols].astype(int)
+    blunders_df_sorted = gw_transfers(option, horizon)
 
     st.write(f"#### Transfer Results for Gameweek {option}")
     st.dataframe(
@@ -180,3 +148,49 @@ with transactions_gw:
         hide_index=True,
         use_container_width=True,
     )
+
+    players = gw_transfer_players(option)
+    if players:
+        st.write(f"#### Points per Gameweek of the Players Moved in Gameweek {option}")
+        st.line_chart(player_stat(players))
+
+with team_boards:
+    st.subheader("🏅 Transfer Leaderboards")
+    st.caption("Leaderboards count the points of the next gameweek only.")
+
+    team = st.selectbox("Choose Team", leaderboard_teams())
+    col1, col2 = st.columns(2)
+    with col1:
+        st.write(f"#### ✅ Best Transfers by {team}")
+        st.dataframe(
+            leaderboard("top_by_team", team=team).style.background_gradient(
+                cmap="YlGn", subset=["Net Points"]
+            ),
+            hide_index=True,
+            use_container_width=True,
+        )
+    with col2:
+        st.write(f"#### ❌ Worst Transfers by {team}")
+        st.dataframe(
+            leaderboard("bottom_by_team", team=team).style.background_gradient(
+                cmap="YlOrRd_r", subset=["Net Points"]
+            ),
+            hide_index=True,
+            use_container_width=True,
+        )
+
+    kinds = {"w": "Waivers", "f": "Free Agents"}
+    for kind, label in kinds.items():
+        st.write(f"#### {label}")
+        col1, col2 = st.columns(2)
+        for col, board, cmap in [
+            (col1, "top_by_kind", "YlGn"),
+            (col2, "bottom_by_kind", "YlOrRd_r"),
+        ]:
+            col.dataframe(
+                leaderboard(board, kind=kind).style.background_gradient(
+                    cmap=cmap, subset=["Net Points"]
+                ),
+                hide_index=True,
+                use_container_width=True,
+            )
@@ -0,0 +1,462 @@
+import argparse
+import json
+import os
+import random
+import subprocess
+import tempfile
+import time
+import duckdb
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from loguru import logger
+from typing import List
+from data_ingest import league_dir
+from data_store import RawStore
+from data_preprocess import (
+    load_json_to_table,
+    load_team_history,
+    load_gw_live,
+    load_gw_event,
+    store_live,
+)
+from data_transform import (
+    concat_team_points,
+    calc_points_bracket,
+    calc_bench_pts,
+    calc_blunders,
+    calc_running_standings,
+    calc_cumm_points,
+    top_n_transfers,
+    calc_squads,
+    calc_points_index,
+    calc_transfer_horizons,
+    export_tables,
+    export_bundle,
+)
+from lineup import calc_autosubs, calc_optimal_lineups
+from stat_cube import build_stat_cube
+
+SQL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sql")
+
+# Benchmark sizes, from our own league up to a large multi-season dataset
+PRESETS = {
+    "league": {"managers": 7, "gameweeks": 38, "players": 800, "transactions": 1.0},
+    "medium": {"managers": 100, "gameweeks": 38, "players": 800, "transactions": 1.0},
+    "large": {
+        "managers": 1000,
+        "gameweeks": 38,
+        "players": 800,
+        "transactions": 1.0,
+        "seasons": 3,
+    },
+}
+
+LEAGUE_CODE = 1
+POSITIONS = {1: 2, 2: 5, 3: 5, 4: 3}  # element_type: picks per squad
+STARTERS = {1: 1, 2: 4, 3: 4, 4: 2}  # element_type: picks in the starting 11
+
+# Live stats, with the generator of each value from the player's minutes
+LIVE_STATS = {
+    "minutes": lambda rng, minutes: minutes,
+    "goals_scored": lambda rng, minutes: rng.choice([0] * 8 + [1, 2]) * (minutes > 0),
+    "assists": lambda rng, minutes: rng.choice([0] * 8 + [1, 2]) * (minutes > 0),
+    "clean_sheets": lambda rng, minutes: int(minutes >= 60 and rng.random() < 0.3),
+    "goals_conceded": lambda rng, minutes: rng.randint(0, 3) * (minutes > 0),
+    "own_goals": lambda rng, minutes: 0,
+    "penalties_saved": lambda rng, minutes: 0,
+    "penalties_missed": lambda rng, minutes: 0,
+    "yellow_cards": lambda rng, minutes: int(rng.random() < 0.1),
+    "red_cards": lambda rng, minutes: 0,
+    "saves": lambda rng, minutes: rng.randint(0, 5) * (minutes > 0),
+    "bonus": lambda rng, minutes: rng.choice([0] * 9 + [1, 2, 3]),
+    "bps": lambda rng, minutes: rng.randint(0, 40) * (minutes > 0),
+    "influence": lambda rng, minutes: round(rng.uniform(0, 60), 1),
+    "creativity": lambda rng, minutes: round(rng.uniform(0, 60), 1),
+    "threat": lambda rng, minutes: round(rng.uniform(0, 60), 1),
+    "ict_index": lambda rng, minutes: round(rng.uniform(0, 15), 1),
+    "starts": lambda rng, minutes: int(minutes > 0),
+    "expected_goals": lambda rng, minutes: round(rng.uniform(0, 1), 2),
+    "expected_assists": lambda rng, minutes: round(rng.uniform(0, 1), 2),
+    "total_points": lambda rng, minutes: rng.randint(-1, 15) if minutes else 0,
+    "in_dreamteam": lambda rng, minutes: rng.random() < 0.02,
+}
+
+
+def write_json(path: str, payload) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as fp:
+        json.dump(payload, fp)
+
+
+def generate_league(
+    root: str,
+    managers: int,
+    gameweeks: int,
+    players: int,
+    transactions: float,
+    seed: int = 0,
+) -> None:
+    """
+    Write a synthetic league under root in the layout the pipeline reads.
+
+    The payloads have the shapes of bootstrap-static.json, event-status.json,
+    details.json, choices.json, transactions.json, team_{id}/history.json,
+    team_{id}/{gw}_event.json and the raw event/{gw}/live payloads, which are
+    left in drafty/data/gw to be stored by the ingest step. `transactions` is
+    the average number of accepted transactions per manager and gameweek,
+    and the picks follow the squads they leave.
+    """
+    rng = random.Random(seed)
+    data_dir = f"{root}/drafty/data"
+    data_league = f"{root}/{league_dir(LEAGUE_CODE)}"
+
+    element_types = [rng.choice([1, 2, 2, 3, 3, 4]) for _ in range(players)]
+    elements = [
+        {
+            "id": i + 1,
+            "web_name": f"Player {i + 1}",
+            "first_name": "Player",
+            "second_name": str(i + 1),
+            "element_type": element_type,
+            "team": i % 20 + 1,
+        }
+        for i, element_type in enumerate(element_types)
+    ]
+    write_json(
+        f"{data_dir}/bootstrap-static.json",
+        {
+            "elements": elements,
+            "events": {
+                "current": gameweeks,
+                "data": [
+                    {"id": gw, "finished": True} for gw in range(1, gameweeks + 1)
+                ],
+                "next": None,
+            },
+        },
+    )
+    write_json(
+        f"{data_dir}/event-status.json",
+        {"status": [{"event": gameweeks, "points": "r"}], "leagues": "Updated"},
+    )
+
+    entries = [100000 + i for i in range(managers)]
+    write_json(
+        f"{data_league}/details.json",
+        {
+            "league": {"id": LEAGUE_CODE, "name": "Benchmark League"},
+            "league_entries": [
+                {
+                    "entry_id": entry,
+                    "entry_name": f"Team {i + 1}",
+                    "id": i + 1,
+                    "player_first_name": f"Manager{i + 1}",
+                    "player_last_name": "Benchmark",
+                    "short_name": f"M{i + 1}",
+                    "waiver_pick": i + 1,
+                }
+                for i, entry in enumerate(entries)
+            ],
+            "standings": [
+                {"league_entry": i + 1, "rank": i + 1, "total": 0}
+                for i in range(managers)
+            ],
+        },
+    )
+
+    by_type = {
+        t: [e["id"] for e in elements if e["element_type"] == t] for t in POSITIONS
+    }
+    # Draft squads, then moves that swap a player for one of the same type
+    squads = {
+        entry: {t: rng.sample(by_type[t], count) for t, count in POSITIONS.items()}
+        for entry in entries
+    }
+    write_json(
+        f"{data_league}/choices.json",
+        {
+            "choices": [
+                {"entry": entry, "element": element}
+                for entry, squad in squads.items()
+                for picks in squad.values()
+                for element in picks
+            ]
+        },
+    )
+    moves = []
+    squads_by_gw = {}
+    for gw in range(1, gameweeks + 1):
+        for _ in range(int(managers * transactions) if gw > 1 else 0):
+            entry = rng.choice(entries)
+            element_type = rng.choice(list(POSITIONS))
+            picks = squads[entry][element_type]
+            element_in = rng.choice(by_type[element_type])
+            if element_in in picks:
+                continue
+            out = rng.randrange(len(picks))
+            moves.append((gw, entry, element_in, picks[out]))
+            picks[out] = element_in
+        squads_by_gw[gw] = {
+            entry: {t: list(picks) for t, picks in squad.items()}
+            for entry, squad in squads.items()
+        }
+    write_json(
+        f"{data_league}/transactions.json",
+        {
+            "transactions": [
+                {
+                    "element_in": element_in,
+                    "element_out": element_out,
+                    "entry": entry,
+                    "event": gw,
+                    "id": n,
+                    "kind": rng.choice(["w", "f"]),
+                    "result": "a",
+                }
+                for n, (gw, entry, element_in, element_out) in enumerate(moves)
+            ]
+        },
+    )
+
+    for gw in range(1, gameweeks + 1):
+        live = {}
+        for element in elements:
+            minutes = rng.choice([0, 0, 20, 60, 90, 90])
+            stats = {name: value(rng, minutes) for name, value in LIVE_STATS.items()}
+            live[str(element["id"])] = {"stats": stats, "explain": []}
+        write_json(f"{data_dir}/gw/{gw}_live.json", {"elements": live, "fixtures": []})
+
+    for entry in entries:
+        team_dir = f"{data_league}/team_{entry}"
+        history = []
+        for gw in range(1, gameweeks + 1):
+            squad = {
+                t: rng.sample(picks, len(picks))
+                for t, picks in squads_by_gw[gw][entry].items()
+            }
+            # A 4-4-2 starting 11 in positions 1-11, the rest on the bench
+            lineup = [e for t, n in STARTERS.items() for e in squad[t][:n]] + [
+                e for t, n in STARTERS.items() for e in squad[t][n:]
+            ]
+            picks = [
+                {"element": element, "position": position + 1}
+                for position, element in enumerate(lineup)
+            ]
+            write_json(
+                f"{team_dir}/{gw}_event.json",
+                {"picks": picks, "entry_history": {}, "subs": []},
+            )
+            history.append(
+                {
+                    "id": gw,
+                    "points": rng.randint(10, 90),
+                    "total_points": 0,
+                    "event_transfers": 0,
+                    "points_on_bench": rng.randint(0, 20),
+                    "entry": entry,
+                    "event": gw,
+                }
+            )
+        write_json(f"{team_dir}/history.json", {"history": history, "entry": {}})
+
+
+@contextmanager
+def timed(timings: dict, stage: str):
+    start = time.perf_counter()
+    yield
+    timings[stage] = round(time.perf_counter() - start, 4)
+    logger.info(f"{stage}: {timings[stage]:.3f}s")
+
+
+def run_stages(con: duckdb.DuckDBPyConnection, gameweeks: int, top_n: int) -> dict:
+    """Run ingest-load, every transform and the exports, timing each stage."""
+    timings = {}
+    data_league = league_dir(LEAGUE_CODE)
+    gw_list = list(range(1, gameweeks + 1))
+
+    with timed(timings, "ingest_store_live"):
+        store = RawStore()
+        for gw in gw_list:
+            store_live(store, gw, f"drafty/data/gw/{gw}_live.json", True, False)
+        store.save()
+
+    data_files = {
+        f"{data_league}/details.json": ["league_entries", "league", "standings"],
+        "drafty/data/event-status.json": ["status"],
+        "drafty/data/bootstrap-static.json": ["elements"],
+        f"{data_league}/transactions.json": ["transactions"],
+        f"{data_league}/choices.json": ["choices"],
+    }
+    for file_path, keys in data_files.items():
+        with timed(timings, f"load_{keys[0]}"):
+            load_json_to_table(con=con, file_path=file_path, keys=keys)
+
+    entries = [r[0] for r in con.sql("SELECT entry_id FROM league_entries").fetchall()]
+    with timed(timings, "load_team_history"):
+        load_team_history(con=con, entries=entries, data_dir=data_league)
+    with timed(timings, "load_gw_live"):
+        load_gw_live(con=con, gameweeks=gw_list)
+    with timed(timings, "load_gw_event"):
+        load_gw_event(con=con, entries=entries, data_dir=data_league)
+
+    brackets = {
+        "1": ["1", str(gameweeks // 3)],
+        "2": [str(gameweeks // 3 + 1), str(2 * gameweeks // 3)],
+        "3": [str(2 * gameweeks // 3 + 1), str(gameweeks)],
+    }
+    cube_dir = f"{data_league}/stat_cube"
+    transforms = [
+        ("concat_team_points", concat_team_points, {}),
+        ("calc_bench_pts", calc_bench_pts, {}),
+        ("calc_blunders", calc_blunders, {}),
+        ("calc_running_standings", calc_running_standings, {}),
+        ("calc_cumm_points", calc_cumm_points, {}),
+        ("top_n_transfers", top_n_transfers, {"k": top_n}),
+        ("calc_squads", calc_squads, {}),
+        ("calc_points_index", calc_points_index, {}),
+        ("calc_transfer_horizons", calc_transfer_horizons, {}),
+        ("build_stat_cube", build_stat_cube, {"cube_dir": cube_dir}),
+        ("calc_autosubs", calc_autosubs, {"cube_dir": cube_dir}),
+        ("calc_optimal_lineups", calc_optimal_lineups, {"cube_dir": cube_dir}),
+    ] + [
+        (
+            f"calc_points_bracket_{b}",
+            calc_points_bracket,
+            {"brackets": brackets, "bracket": b},
+        )
+        for b in brackets
+    ]
+    for name, func, kwargs in transforms:
+        with timed(timings, name):
+            func(con=con, **kwargs)
+
+    for export_format in ["csv", "parquet"]:
+        with timed(timings, f"export_{export_format}"):
+            export_tables(
+                con=con,
+                brackets=brackets,
+                gameweeks=gw_list,
+                out_dir=data_league,
+                formats=[export_format],
+            )
+    with timed(timings, "export_bundle"):
+        export_bundle(
+            con=con, brackets=brackets, prizes={}, path=f"{data_league}/bundle.json"
+        )
+
+    return timings
+
+
+def run_benchmark(
+    managers: int,
+    gameweeks: int,
+    players: int,
+    transactions: float,
+    seasons: int = 1,
+    top_n: int = 10,
+    seed: int = 0,
+) -> dict:
+    """
+    Generate a synthetic league in a temporary directory and time the pipeline
+    stages on it. Seasons are laid out as consecutive gameweeks of one league.
+    """
+    gameweeks = gameweeks * seasons
+    sizes = {
+        "managers": managers,
+        "gameweeks": gameweeks,
+        "players": players,
+        "transactions": transactions,
+        "seasons": seasons,
+    }
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as root:
+        start = time.perf_counter()
+        generate_league(root, managers, gameweeks, players, transactions, seed)
+        generate_seconds = round(time.perf_counter() - start, 4)
+        logger.info(f"Generated {sizes} in {generate_seconds:.1f}s")
+
+        os.symlink(SQL_DIR, f"{root}/drafty/sql")
+        os.chdir(root)
+        try:
+            with duckdb.connect(f"{league_dir(LEAGUE_CODE)}/drafty.db") as con:
+                timings = run_stages(con, gameweeks, top_n)
+                tables = [
+                    r[0]
+                    for r in con.sql(
+                        "SELECT table_name FROM duckdb_tables() ORDER BY 1"
+                    ).fetchall()
+                ]
+                rows = {
+                    t: con.sql(f"SELECT count(*) FROM {t}").fetchone()[0]
+                    for t in tables
+                }
+                db_bytes = os.path.getsize(f"{league_dir(LEAGUE_CODE)}/drafty.db")
+        finally:
+            os.chdir(cwd)
+
+    return {
+        "sizes": sizes,
+        "generate_seconds": generate_seconds,
+        "timings": timings,
+        "total_seconds": round(sum(timings.values()), 4),
+        "rows": rows,
+        "db_bytes": db_bytes,
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(SQL_DIR),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def parse_arguments(cli_args: list[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("--preset", default="league", choices=list(PRESETS))
+    parser.add_argument("--managers", type=int)
+    parser.add_argument("--gameweeks", type=int)
+    parser.add_argument("--players", type=int)
+    parser.add_argument("--transactions", type=float)
+    parser.add_argument("--seasons", type=int)
+    parser.add_argument("--seed", default=0, type=int)
+    parser.add_argument("--output-dir", default="benchmarks")
+
+    return parser.parse_args(args=cli_args)
+
+
+def main(cli_args: List[str]):
+    args = parse_arguments(cli_args=cli_args)
+
+    sizes = {"seasons": 1, **PRESETS[args.preset]}
+    for size in ["managers", "gameweeks", "players", "transactions", "seasons"]:
+        if getattr(args, size) is not None:
+            sizes[size] = getattr(args, size)
+
+    result = run_benchmark(**sizes, seed=args.seed)
+    commit = git_commit()
+    result = {
+        "preset": args.preset,
+        "commit": commit,
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        **result,
+    }
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    path = f"{args.output_dir}/{args.preset}-{commit}.json"
+    with open(path, "w") as fp:
+        json.dump(result, fp, indent=1)
+    logger.info(f"Benchmark took {result['total_seconds']:.2f}s, results in {path}")
+
+
+if __name__ == "__main__":
+    import sys
+
+    main(sys.argv[1:])
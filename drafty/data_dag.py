@@ -0,0 +1,200 @@
+import hashlib
+import inspect
+import os
+import re
+import threading
+import time
+import duckdb
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass, field
+from loguru import logger
+from typing import Callable, Dict, List
+from data_transform import read_sql_template
+
+# drafty/sql templates named in the source of a transform
+TEMPLATE_PATTERN = re.compile(r"[\w-]+\.sql")
+
+
+@dataclass
+class Node:
+    """
+    A transform reading `inputs` and (re)creating `outputs`, which are table
+    names or file paths (anything containing a "/").
+    """
+
+    name: str
+    func: Callable
+    inputs: List[str]
+    outputs: List[str]
+    kwargs: dict = field(default_factory=dict)
+
+
+def table_signature(con: duckdb.DuckDBPyConnection, table: str) -> str:
+    """
+    Content fingerprint of a table: row count and an order-independent row
+    hash. The hashes are summed rather than xor-ed, so that a pair of
+    identical rows does not cancel out.
+    """
+    exists = con.execute(
+        "SELECT count(*) FROM duckdb_tables() WHERE table_name = ?", [table]
+    ).fetchone()[0]
+    if not exists:
+        return f"{table}:missing"
+    rows, digest = con.sql(f"SELECT count(*), sum(hash(t)) FROM {table} t").fetchone()
+    return f"{table}:{rows}:{digest}"
+
+
+def file_signature(path: str) -> str:
+    """Content fingerprint of a file: its size and sha256."""
+    if not os.path.exists(path):
+        return f"{path}:missing"
+    sha = hashlib.sha256()
+    with open(path, "rb") as fp:
+        for chunk in iter(lambda: fp.read(1024**2), b""):
+            sha.update(chunk)
+    return f"{path}:{os.path.getsize(path)}:{sha.hexdigest()}"
+
+
+def project_modules(module) -> List:
+    """
+    The module and every module from its own directory that it imports,
+    directly or through another project module, ordered by name.
+    """
+    root = os.path.dirname(os.path.abspath(module.__file__))
+    found = {module.__name__: module}
+    queue = [module]
+    while queue:
+        for value in list(vars(queue.pop()).values()):
+            imported = value if inspect.ismodule(value) else inspect.getmodule(value)
+            path = getattr(imported, "__file__", None)
+            if (
+                imported is None
+                or imported.__name__ in found
+                or not path
+                or os.path.dirname(os.path.abspath(path)) != root
+            ):
+                continue
+            found[imported.__name__] = imported
+            queue.append(imported)
+    return [found[name] for name in sorted(found)]
+
+
+def code_signature(func: Callable) -> str:
+    """
+    Fingerprint of the code of a transform: its name, the source of its
+    module and of the project modules it imports, and every drafty/sql
+    template named in its source. An edit to any of those reruns the
+    transform.
+    """
+    source = inspect.getsource(func)
+    parts = [f"{func.__module__}.{func.__qualname__}"]
+    for module in project_modules(inspect.getmodule(func)):
+        parts.append(inspect.getsource(module))
+    for template in sorted(set(TEMPLATE_PATTERN.findall(source))):
+        if os.path.exists(os.path.join("drafty/sql", template)):
+            parts.append(read_sql_template(template))
+    return hashlib.sha256("|".join(parts).encode()).hexdigest()
+
+
+def run_dag(
+    con: duckdb.DuckDBPyConnection,
+    nodes: List[Node],
+    max_workers: int = 4,
+    skip_unchanged: bool = True,
+) -> Dict[str, dict]:
+    """
+    Run transform nodes in dependency order, independent nodes in parallel.
+
+    A node is ready once every node producing one of its inputs has finished.
+    Each node runs on its own DuckDB cursor. With skip_unchanged, a node whose
+    inputs, kwargs and code have the same fingerprint as on its last
+    successful run, and whose output tables and files still exist, is
+    skipped.
+
+    Returns:
+        dict: {node name: {"status": "ran" | "skipped", "seconds": wall time}}
+    """
+    producers = {table: node.name for node in nodes for table in node.outputs}
+    upstream = {
+        node.name: {producers[t] for t in node.inputs if t in producers}
+        for node in nodes
+    }
+    by_name = {node.name: node for node in nodes}
+
+    con.sql(
+        """
+        CREATE TABLE IF NOT EXISTS dag_state (
+            node VARCHAR PRIMARY KEY,
+            signature VARCHAR,
+            updated_at TIMESTAMP
+        )
+        """
+    )
+    signatures = {}
+    lock = threading.Lock()
+
+    def signature(cursor, name):
+        with lock:
+            if name in signatures:
+                return signatures[name]
+        if "/" in name:
+            sig = file_signature(name)
+        else:
+            sig = table_signature(cursor, name)
+        with lock:
+            signatures[name] = sig
+        return sig
+
+    def run_node(node):
+        cursor = con.cursor()
+        start = time.perf_counter()
+        node_sig = hashlib.sha256(
+            "|".join(
+                [signature(cursor, t) for t in node.inputs]
+                + [repr(node.kwargs), code_signature(node.func)]
+            ).encode()
+        ).hexdigest()
+
+        last = cursor.execute(
+            "SELECT signature FROM dag_state WHERE node = ?", [node.name]
+        ).fetchone()
+        outputs_exist = all(
+            not signature(cursor, t).endswith(":missing") for t in node.outputs
+        )
+        if skip_unchanged and last and last[0] == node_sig and outputs_exist:
+            status = "skipped"
+        else:
+            node.func(con=cursor, **node.kwargs)
+            cursor.execute(
+                "INSERT OR REPLACE INTO dag_state VALUES (?, ?, now())",
+                [node.name, node_sig],
+            )
+            status = "ran"
+            with lock:
+                # Outputs changed, fingerprint them again for downstream nodes
+                for output in node.outputs:
+                    signatures.pop(output, None)
+
+        seconds = time.perf_counter() - start
+        cursor.close()
+        logger.info(f"Node {node.name} {status} in {seconds:.3f}s")
+        return {"status": status, "seconds": seconds}
+
+    report = {}
+    done = set()
+    pending = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while len(done) < len(nodes):
+            for name, deps in upstream.items():
+                if name not in done and name not in pending.values():
+                    if deps <= done:
+                        pending[pool.submit(run_node, by_name[name])] = name
+            if not pending:
+                raise ValueError(f"Cycle between nodes {set(upstream) - done}")
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = pending.pop(future)
+                report[name] = future.result()
+                done.add(name)
+
+    return report
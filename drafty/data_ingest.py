@@ -1,22 +1,443 @@
+import hashlib
 import requests
 import json
 import os
+import shutil
+import threading
+import time
+import zipfile
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlparse
 from loguru import logger
+from data_metrics import Stage
+from data_store import RawStore
 
+# Fetch engine settings, overridable from the `ingest` section of config.yaml
+FETCH_SETTINGS = {
+    # API every request is built against, DRAFTY_API_URL points it at a stub
+    "base_url": os.environ.get(
+        "DRAFTY_API_URL", "https://draft.premierleague.com/api/"
+    ),
+    "max_workers": 8,  # concurrent requests in flight
+    "rate_limit": 10.0,  # max requests per second per host
+    "retries": 3,  # retries after the first attempt
+    "backoff": 0.5,  # seconds, doubled on every retry
+    "cache_max_mb": 256,  # total size of the bodies kept by the response cache
+    "keep_explain": False,  # keep the per fixture points breakdown of live data
+    "record": None,  # snapshot archive every fetched file is recorded into
+    "replay": None,  # snapshot archive every fetch is served from, offline
+}
 
-def get_json(json_files, apis) -> None:
-    with requests.Session() as session:
-        for file, api in zip(json_files, apis):
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# League independent resources live in DATA_DIR, everything fetched for a
+# league in its own league_dir
+DATA_DIR = "drafty/data"
+CACHE_INDEX_FILE = f"{DATA_DIR}/http_cache.json"
+
+
+def league_dir(league_code) -> str:
+    return f"{DATA_DIR}/league_{league_code}"
+
+
+def api_url(endpoint: str) -> str:
+    return f"{FETCH_SETTINGS['base_url']}{endpoint}"
+
+
+def config_leagues(config: dict) -> list:
+    """League codes of config.yaml, `leagues` or the legacy single `league_code`."""
+    return config.get("leagues") or [config.get("league_code")]
+
+
+def configure(**settings) -> None:
+    unknown = set(settings) - set(FETCH_SETTINGS)
+    if unknown:
+        raise ValueError(f"Unknown ingest settings: {sorted(unknown)}")
+    FETCH_SETTINGS.update(settings)
+
+
+class RateLimiter:
+    """Spaces out requests to the same host to at most `rate` per second."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.next_slot = {}
+        self.lock = threading.Lock()
+
+    def wait(self, url: str) -> None:
+        host = urlparse(url).netloc
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class ResponseCache:
+    """
+    Persistent HTTP validator cache keyed by url.
+
+    A copy of every cached body is kept under the sha256 of its bytes in a
+    bodies directory next to the index, so a 304 can restore the json file
+    the response was written to. Entries and their bodies are evicted least
+    recently used once the bodies exceed `max_bytes`; an evicted url is
+    fetched unconditionally next time. Without an index_file nothing is
+    cached, e.g. for live data moved into the raw store.
+    """
+
+    def __init__(self, index_file: str, max_bytes: int):
+        self.index_file = index_file
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.entries = {}
+        if index_file is None:
+            return
+        self.bodies_dir = f"{index_file.removesuffix('.json')}_bodies"
+        if os.path.exists(index_file):
+            with open(index_file) as fp:
+                # Entries from before bodies were kept cannot be served
+                self.entries = {
+                    api: entry
+                    for api, entry in json.load(fp).items()
+                    if "body" in entry
+                }
+
+    def body_path(self, digest: str) -> str:
+        return f"{self.bodies_dir}/{digest}.json"
+
+    def headers(self, api: str, file: str) -> dict:
+        with self.lock:
+            entry = self.entries.get(api)
+        if not entry or entry["file"] != file:
+            return {}
+        if not os.path.exists(self.body_path(entry["body"])):
+            return {}
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def hit(self, api: str, file: str) -> None:
+        """Count a 304 and restore file from the cached body if it changed."""
+        with self.lock:
+            self.hits += 1
+            entry = self.entries[api]
+            entry["last_used"] = time.time()
+        if not os.path.exists(file) or RawStore.digest(file) != entry["body"]:
+            shutil.copyfile(self.body_path(entry["body"]), file)
+
+    def store(self, api: str, file: str, response) -> None:
+        with self.lock:
+            self.misses += 1
+            if self.index_file is None:
+                return
+            etag = response.headers.get("ETag")
+            last_modified = response.headers.get("Last-Modified")
+            if not etag and not last_modified:
+                self.entries.pop(api, None)
+                return
+        digest = RawStore.digest(file)
+        os.makedirs(self.bodies_dir, exist_ok=True)
+        if not os.path.exists(self.body_path(digest)):
+            shutil.copyfile(file, f"{self.body_path(digest)}.tmp")
+            os.replace(f"{self.body_path(digest)}.tmp", self.body_path(digest))
+        with self.lock:
+            self.entries[api] = {
+                "file": file,
+                "etag": etag,
+                "last_modified": last_modified,
+                "body": digest,
+                "size": os.path.getsize(file),
+                "last_used": time.time(),
+            }
+
+    def evict(self) -> None:
+        """Drop least recently used entries, and bodies no entry refers to."""
+        sizes = {entry["body"]: entry["size"] for entry in self.entries.values()}
+        total = sum(sizes.values())
+        for api, entry in sorted(
+            self.entries.items(), key=lambda item: item[1]["last_used"]
+        ):
+            if total <= self.max_bytes:
+                break
+            del self.entries[api]
+            if all(other["body"] != entry["body"] for other in self.entries.values()):
+                total -= entry["size"]
+
+        referenced = {entry["body"] for entry in self.entries.values()}
+        if os.path.isdir(self.bodies_dir):
+            for body in os.listdir(self.bodies_dir):
+                if body.removesuffix(".json") not in referenced:
+                    os.remove(f"{self.bodies_dir}/{body}")
 
+    def save(self) -> None:
+        if self.index_file is None:
+            return
+        with self.lock:
+            self.evict()
+            with open(self.index_file, "w") as fp:
+                json.dump(self.entries, fp, indent=1, sort_keys=True)
+
+
+def fetch(session, file, api, limiter, retries, backoff, cache) -> bool:
+    """Fetch api into file, returning False when the server answered 304."""
+    headers = cache.headers(api, file)
+    with Stage("fetch", api) as stage:
+        for attempt in range(retries + 1):
+            limiter.wait(api)
             logger.info(f"Fetching {file} from {api}")
-            response = session.get(api)
-            response.raise_for_status()  # Raise an exception for HTTP errors
+            try:
+                response = session.get(api, headers=headers, timeout=30)
+                if response.status_code == 304:
+                    logger.info(f"Not modified, reusing {file}")
+                    cache.hit(api, file)
+                    stage.bytes = 0
+                    stage.extra.update(status_code=304, attempts=attempt + 1)
+                    return False
+                if response.status_code not in RETRY_STATUS_CODES:
+                    response.raise_for_status()  # Raise an exception for HTTP errors
+                    break
+                error = requests.HTTPError(f"{response.status_code} for {api}")
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
 
-            with open(file, "w") as outfile:
-                json.dump(response.json(), outfile)
+            if attempt == retries:
+                raise error
+            delay = backoff * 2**attempt
+            logger.warning(f"Retrying {api} in {delay:.1f}s ({error})")
+            time.sleep(delay)
 
+        stage.bytes = len(response.content)
+        stage.extra.update(status_code=response.status_code, attempts=attempt + 1)
+        with open(file, "w") as outfile:
+            json.dump(response.json(), outfile)
+    cache.store(api, file, response)
+    return True
 
-def get_static_data() -> list:
+
+def snapshot_mode() -> bool:
+    """True when recording or replaying, which fetches every resource in full."""
+    return bool(FETCH_SETTINGS["record"] or FETCH_SETTINGS["replay"])
+
+
+def snapshot_key(api: str) -> str:
+    """Archive key of an api url, independent of the host it was fetched from."""
+    return api.removeprefix(FETCH_SETTINGS["base_url"])
+
+
+def record_snapshot(archive: str, json_files, apis) -> None:
+    """
+    Stage fetched files for the snapshot archive, see pack_snapshot.
+
+    Files are staged in {archive}.parts/ under the sha256 of their bytes with
+    one index line per api, so parallel league processes can record at once.
+    """
+    parts = f"{archive}.parts"
+    os.makedirs(f"{parts}/bodies", exist_ok=True)
+    lines = []
+    for file, api in zip(json_files, apis):
+        with open(file, "rb") as fp:
+            body = fp.read()
+        digest = hashlib.sha256(body).hexdigest()
+        with open(f"{parts}/bodies/{digest}.json", "wb") as fp:
+            fp.write(body)
+        lines.append(json.dumps({"key": snapshot_key(api), "body": digest}) + "\n")
+    with open(f"{parts}/index.jsonl", "a") as fp:
+        fp.writelines(lines)
+
+
+def pack_snapshot(archive: str) -> None:
+    """
+    Pack the files staged by record_snapshot into one deflate compressed zip.
+
+    The archive holds bodies/{sha256}.json, each body once, and index.json
+    mapping every api key to its body. A key recorded more than once keeps
+    its last body.
+    """
+    parts = f"{archive}.parts"
+    index = {}
+    with open(f"{parts}/index.jsonl") as fp:
+        for line in fp:
+            entry = json.loads(line)
+            index[entry["key"]] = entry["body"]
+
+    with zipfile.ZipFile(archive, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("index.json", json.dumps(index, indent=1, sort_keys=True))
+        for digest in sorted(set(index.values())):
+            zf.write(f"{parts}/bodies/{digest}.json", f"bodies/{digest}.json")
+    shutil.rmtree(parts)
+    logger.info(f"Recorded {len(index)} responses into {archive}")
+
+
+def replay_snapshot(archive: str, json_files, apis) -> list:
+    """Write every api from the snapshot archive into its file, without network."""
+    with zipfile.ZipFile(archive) as zf:
+        index = json.loads(zf.read("index.json"))
+        for file, api in zip(json_files, apis):
+            key = snapshot_key(api)
+            if key not in index:
+                raise KeyError(f"{key} was not recorded in {archive}")
+            with Stage("fetch", api) as stage:
+                body = zf.read(f"bodies/{index[key]}.json")
+                with open(file, "wb") as fp:
+                    fp.write(body)
+                stage.bytes = len(body)
+                stage.extra["replay"] = archive
+    logger.info(f"Replayed {len(apis)} responses from {archive}")
+    return list(json_files)
+
+
+def get_json(json_files, apis, cache_index=CACHE_INDEX_FILE) -> list:
+    """
+    Fetch every api into the matching file as one concurrent batch.
+
+    Requests are spread over a bounded thread pool, throttled per host and
+    retried with exponential backoff on connection errors, 429 and 5xx.
+    Requests carry the validators of the last response for the url, and files
+    the server reports as not modified are left untouched. Concurrent
+    processes should each use their own cache_index.
+
+    With the `replay` setting every file is served from that snapshot
+    archive instead, and with `record` every file is also recorded into it.
+
+    Returns:
+        list: The json files that were (re)written.
+    """
+    settings = FETCH_SETTINGS
+    if settings["replay"]:
+        return replay_snapshot(settings["replay"], json_files, apis)
+
+    limiter = RateLimiter(settings["rate_limit"])
+    cache = ResponseCache(cache_index, settings["cache_max_mb"] * 1024**2)
+    workers = max(1, min(settings["max_workers"], len(apis)))
+
+    with requests.Session() as session:
+        adapter = HTTPAdapter(pool_maxsize=workers)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(
+                    fetch,
+                    session,
+                    file,
+                    api,
+                    limiter,
+                    settings["retries"],
+                    settings["backoff"],
+                    cache,
+                )
+                for file, api in zip(json_files, apis)
+            ]
+            try:
+                changed = [
+                    file for file, future in zip(json_files, futures) if future.result()
+                ]
+            finally:
+                cache.save()
+
+    logger.info(f"Response cache: {cache.hits} hits, {cache.misses} misses")
+    if settings["record"]:
+        record_snapshot(settings["record"], json_files, apis)
+    return changed
+
+
+def trim_live(file: str, explain_file: str = None) -> None:
+    """
+    Rewrite an event/{gw}/live payload in place, keeping only the element stats.
+
+    The stats are stored column wise, as one list of stat names and one list
+    of values per element. The per fixture explain arrays, which make up most
+    of the payload, are dropped, or written to explain_file as
+    [element, fixture, stat, points, value] rows.
+    """
+    with open(file) as fp:
+        elements = json.load(fp)["elements"]
+
+    names = list(dict.fromkeys(n for el in elements.values() for n in el["stats"]))
+    live = {
+        "stats": names,
+        "elements": {
+            element_id: [el["stats"].get(name) for name in names]
+            for element_id, el in elements.items()
+        },
+    }
+    with open(file, "w") as fp:
+        json.dump(live, fp, separators=(",", ":"))
+
+    if explain_file:
+        rows = [
+            [int(element_id), fixture, e["stat"], e["points"], e["value"]]
+            for element_id, el in elements.items()
+            for breakdown, fixture in el["explain"]
+            for e in breakdown
+        ]
+        with open(explain_file, "w") as fp:
+            json.dump({"explain": rows}, fp, separators=(",", ":"))
+
+
+def fetch_batch(batch: list, cache_index: str = CACHE_INDEX_FILE) -> list:
+    """
+    Fetch a list of (json_file, api) requests built by the *_requests helpers.
+
+    Returns:
+        list: The json files that were (re)written.
+    """
+    if not batch:
+        return []
+    json_files, apis = zip(*batch)
+    return get_json(
+        json_files=list(json_files), apis=list(apis), cache_index=cache_index
+    )
+
+
+def load_manifest(manifest_file: str) -> dict:
+    """Return {json_file: {"gw", "finished", "fetched_at"}} for gameweek resources."""
+    if not os.path.exists(manifest_file):
+        return {}
+    with open(manifest_file) as fp:
+        return json.load(fp)
+
+
+def save_manifest(manifest: dict, manifest_file: str) -> None:
+    with open(manifest_file, "w") as fp:
+        json.dump(manifest, fp, indent=1, sort_keys=True)
+
+
+def is_fresh(manifest: dict, json_file: str) -> bool:
+    """A gameweek resource is fresh once fetched after its gameweek finished."""
+    entry = manifest.get(json_file)
+    return bool(entry and entry["finished"] and os.path.exists(json_file))
+
+
+def record_fetched(manifest: dict, batch: list, gw: int, finished: bool) -> None:
+    fetched_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    for json_file, _ in batch:
+        manifest[json_file] = {"gw": gw, "finished": finished, "fetched_at": fetched_at}
+
+
+def finished_gameweeks() -> set:
+    """Gameweeks marked finished in bootstrap-static.json, whose data is immutable."""
+    with open(f"{DATA_DIR}/bootstrap-static.json") as fp:
+        events = json.load(fp)["events"]["data"]
+    return {event["id"] for event in events if event["finished"]}
+
+
+def current_gameweek() -> int:
+    """Current gameweek according to event-status.json."""
+    with open(f"{DATA_DIR}/event-status.json") as fp:
+        return max(status["event"] for status in json.load(fp)["status"])
+
+
+def static_requests() -> list:
     api_endpoints = [
         "bootstrap-dynamic",
         "game",
@@ -24,18 +445,13 @@ def get_static_data() -> list:
         "pl/event-status",
     ]
 
-    base_url = "https://draft.premierleague.com/api/"
-    json_files = [
-        f"drafty/data/{endpoint.split('/')[-1]}.json" for endpoint in api_endpoints
+    return [
+        (f"{DATA_DIR}/{endpoint.split('/')[-1]}.json", api_url(endpoint))
+        for endpoint in api_endpoints
     ]
-    apis = [f"{base_url}{endpoint}" for endpoint in api_endpoints]
-
-    get_json(json_files=json_files, apis=apis)
 
-    return json_files
 
-
-def get_league_data(league_code) -> list:
+def league_requests(league_code) -> list:
     api_endpoints = [
         f"league/{league_code}/details",
         f"league/{league_code}/element-status",
@@ -43,18 +459,16 @@ def get_league_data(league_code) -> list:
         f"draft/{league_code}/choices",
     ]
 
-    base_url = "https://draft.premierleague.com/api/"
-    json_files = [
-        f"drafty/data/{endpoint.split('/')[-1]}.json" for endpoint in api_endpoints
-    ]
-    apis = [f"{base_url}{endpoint}" for endpoint in api_endpoints]
-
-    get_json(json_files=json_files, apis=apis)
+    data_dir = league_dir(league_code)
+    os.makedirs(data_dir, exist_ok=True)
 
-    return json_files
+    return [
+        (f"{data_dir}/{endpoint.split('/')[-1]}.json", api_url(endpoint))
+        for endpoint in api_endpoints
+    ]
 
 
-def get_team_data(team_id):
+def team_requests(team_id, data_dir=DATA_DIR) -> list:
     api_endpoints = [
         f"entry/{team_id}/public",
         f"entry/{team_id}/history",
@@ -62,36 +476,50 @@ def get_team_data(team_id):
         # f"watchlist/{team_id}",
     ]
 
-    base_url = "https://draft.premierleague.com/api/"
-    team_dir = f"drafty/data/team_{team_id}"
+    team_dir = f"{data_dir}/team_{team_id}"
     os.makedirs(team_dir, exist_ok=True)
 
-    json_files = [
-        f"{team_dir}/{endpoint.split('/')[-1]}.json" for endpoint in api_endpoints
+    return [
+        (f"{team_dir}/{endpoint.split('/')[-1]}.json", api_url(endpoint))
+        for endpoint in api_endpoints
     ]
-    apis = [f"{base_url}{endpoint}" for endpoint in api_endpoints]
 
-    get_json(json_files=json_files, apis=apis)
 
+def gw_requests(gw) -> list:
+    gw_dir = f"{DATA_DIR}/gw"
+    os.makedirs(gw_dir, exist_ok=True)  # Create gw directory if it doesn't exist
 
-def get_gw_data(gw):
-    api_endpoints = [f"event/{gw}/live"]
+    return [(f"{gw_dir}/{gw}_live.json", api_url(f"event/{gw}/live"))]
 
-    base_url = "https://draft.premierleague.com/api/"
-    gw_dir = "drafty/data/gw"
-    os.makedirs(gw_dir, exist_ok=True)  # Create gw directory if it doesn't exist
 
-    json_files = [f"{gw_dir}/{gw}_live.json"]
-    apis = [f"{base_url}{endpoint}" for endpoint in api_endpoints]
+def gw_team_requests(team_id, gw, data_dir=DATA_DIR) -> list:
+    team_dir = f"{data_dir}/team_{team_id}"
+    os.makedirs(team_dir, exist_ok=True)
 
-    get_json(json_files=json_files, apis=apis)
+    return [(f"{team_dir}/{gw}_event.json", api_url(f"entry/{team_id}/event/{gw}"))]
 
 
-def get_gw_team_data(team_id, gw):
-    api_endpoints = [f"entry/{team_id}/event/{gw}"]
+def get_static_data() -> list:
+    batch = static_requests()
+    fetch_batch(batch)
 
-    base_url = "https://draft.premierleague.com/api/"
-    json_files = [f"drafty/data/team_{team_id}/{gw}_event.json"]
-    apis = [f"{base_url}{endpoint}" for endpoint in api_endpoints]
+    return [file for file, _ in batch]
 
-    get_json(json_files=json_files, apis=apis)
+
+def get_league_data(league_code) -> list:
+    batch = league_requests(league_code=league_code)
+    fetch_batch(batch)
+
+    return [file for file, _ in batch]
+
+
+def get_team_data(team_id):
+    fetch_batch(team_requests(team_id=team_id))
+
+
+def get_gw_data(gw):
+    fetch_batch(gw_requests(gw=gw))
+
+
+def get_gw_team_data(team_id, gw):
+    fetch_batch(gw_team_requests(team_id=team_id, gw=gw))
@@ -0,0 +1,204 @@
+import json
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from loguru import logger
+
+# Instrumentation settings, overridable from the `metrics` section of config.yaml
+METRICS_SETTINGS = {
+    "profile": True,  # keep a DuckDB query profile of every SQL stage
+    "sink": None,  # json lines file every stage record is appended to
+    "run": None,  # label added to every record, e.g. the league code
+}
+
+# ru_maxrss is in kilobytes on Linux and in bytes on macOS
+RSS_UNIT = 1 if sys.platform == "darwin" else 1024
+
+STAGES = []
+LOCK = threading.Lock()
+
+
+def configure(**settings) -> None:
+    unknown = set(settings) - set(METRICS_SETTINGS)
+    if unknown:
+        raise ValueError(f"Unknown metrics settings: {sorted(unknown)}")
+    METRICS_SETTINGS.update(settings)
+
+
+def peak_rss() -> int:
+    """Peak resident set size of this process so far, in bytes."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * RSS_UNIT
+
+
+def query_profile(path: str, top=3) -> dict:
+    """
+    Summary of the DuckDB JSON profile written to path, or None when no
+    statement was profiled.
+
+    The layout of the profile changed in DuckDB 1.1, both the 1.0 keys
+    (timing, name, cardinality) and the newer ones (latency, operator_*)
+    are read.
+    """
+    if not os.path.exists(path) or not os.path.getsize(path):
+        return None
+    with open(path) as fp:
+        profile = json.load(fp)
+    latency = profile.get("latency", profile.get("timing"))
+    if latency is None:
+        return None
+    operators = []
+
+    def walk(node):
+        for child in node.get("children", []):
+            operators.append(
+                {
+                    "operator": child.get("operator_name", child.get("name")),
+                    "seconds": child.get("operator_timing", child.get("timing")),
+                    "rows": child.get("operator_cardinality", child.get("cardinality")),
+                }
+            )
+            walk(child)
+
+    walk(profile)
+    return {
+        "latency": latency,
+        "cpu_time": profile.get("cpu_time"),
+        "rows_scanned": profile.get("cumulative_rows_scanned"),
+        "peak_buffer_memory": profile.get("system_peak_buffer_memory"),
+        "operators": sorted(operators, key=lambda op: -(op["seconds"] or 0))[:top],
+    }
+
+
+class Stage:
+    """
+    Measures one pipeline stage: wall time, bytes, rows and peak RSS.
+
+    Used as a context manager around a fetch, load, transform or export. The
+    body sets `bytes` and `rows` when it knows them; given `table`, rows are
+    counted from that table on exit. Given a DuckDB connection `con`, the
+    profile of the last query in the body is kept as well.
+
+    Example:
+        with Stage("load", "elements", con=con, table="elements"):
+            con.sql("CREATE OR REPLACE TABLE elements AS ...")
+    """
+
+    def __init__(self, kind: str, name: str, con=None, table: str = None):
+        self.kind = kind
+        self.name = name
+        self.con = con
+        self.table = table
+        self.bytes = None
+        self.rows = None
+        self.extra = {}
+
+    def __enter__(self):
+        self.profile_file = None
+        if self.con is not None and METRICS_SETTINGS["profile"]:
+            # DuckDB 1.0 has no get_profiling_information, so the profile is
+            # written to a file of this stage's own
+            fd, self.profile_file = tempfile.mkstemp(suffix=".json")
+            os.close(fd)
+            self.con.sql("PRAGMA enable_profiling = 'json'")
+            self.con.sql(f"PRAGMA profiling_output = '{self.profile_file}'")
+        self.started_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        self.rss_start = peak_rss()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self.start
+        rss = peak_rss()
+        record = {
+            "kind": self.kind,
+            "name": self.name,
+            "status": "error" if exc_type else "ok",
+            "started_at": self.started_at,
+            "seconds": round(seconds, 6),
+            "bytes": self.bytes,
+            "rows": self.rows,
+            "peak_rss": rss,
+            "rss_growth": rss - self.rss_start,
+            **self.extra,
+        }
+        if METRICS_SETTINGS["run"] is not None:
+            record["run"] = METRICS_SETTINGS["run"]
+        if self.profile_file:
+            # Read before counting rows, which would replace the profile
+            profile = None if exc_type else query_profile(self.profile_file)
+            if profile:
+                record["profile"] = profile
+            self.con.sql("PRAGMA disable_profiling")
+            self.con.sql("PRAGMA profiling_output = ''")
+            if os.path.exists(self.profile_file):
+                os.remove(self.profile_file)
+        if self.con is not None and not exc_type:
+            if self.table and self.rows is None:
+                record["rows"] = self.con.sql(
+                    f"SELECT count(*) FROM {self.table}"
+                ).fetchone()[0]
+        emit(record)
+        return False
+
+
+def emit(record: dict) -> None:
+    with LOCK:
+        STAGES.append(record)
+        sink = METRICS_SETTINGS["sink"]
+        if sink:
+            with open(sink, "a") as fp:
+                fp.write(json.dumps(record) + "\n")
+
+
+def reset() -> None:
+    with LOCK:
+        STAGES.clear()
+
+
+def run_report() -> dict:
+    """
+    Aggregate the stages recorded so far.
+
+    Returns:
+        dict: Totals per stage kind, the slowest stages, the process peak RSS
+            and every stage record.
+    """
+    with LOCK:
+        stages = list(STAGES)
+
+    kinds = defaultdict(lambda: {"stages": 0, "seconds": 0.0, "bytes": 0, "rows": 0})
+    for stage in stages:
+        totals = kinds[stage["kind"]]
+        totals["stages"] += 1
+        totals["seconds"] += stage["seconds"]
+        totals["bytes"] += stage["bytes"] or 0
+        totals["rows"] += stage["rows"] or 0
+
+    return {
+        "run": METRICS_SETTINGS["run"],
+        "generated_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "peak_rss": peak_rss(),
+        "kinds": dict(kinds),
+        "slowest": sorted(stages, key=lambda stage: -stage["seconds"])[:10],
+        "stages": stages,
+    }
+
+
+def write_report(path: str) -> dict:
+    report = run_report()
+    with open(path, "w") as fp:
+        json.dump(report, fp, indent=1)
+
+    summary = ", ".join(
+        f"{kind} {totals['stages']} in {totals['seconds']:.2f}s"
+        for kind, totals in report["kinds"].items()
+    )
+    logger.info(
+        f"Run report {path}: {summary}, peak RSS {report['peak_rss'] / 1024**2:.0f} MB"
+    )
+    return report
@@ -1,10 +1,15 @@
 import argparse
 import os
+import shutil
 import yaml
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import duckdb
+import data_ingest
+import data_metrics
 from loguru import logger
 from typing import List
 from data_preprocess import (
+    fetch_shared_data,
     fetch_and_load_static_league_data,
     fetch_and_load_live_league_data,
 )
@@ -16,49 +21,236 @@ from data_transform import (
     calc_running_standings,
     calc_cumm_points,
     top_n_transfers,
+    calc_squads,
+    calc_points_index,
+    calc_transfer_horizons,
+    export_tables,
+    export_bundle,
+    publish_bundle,
+    processed_gw,
+    create_transform_state,
 )
+from data_dag import Node, run_dag
+from lineup import calc_autosubs, calc_optimal_lineups
+from stat_cube import build_stat_cube
 
 
-def data_pipeline(refresh: bool, league_code: str, brackets: List[str]):
-    con = duckdb.connect("drafty.db")
+def data_pipeline(
+    refresh: bool,
+    league_code: str,
+    brackets: List[str],
+    incremental: bool = False,
+    export: bool = True,
+    top_n: int = 10,
+    transform_workers: int = 4,
+    export_formats: List[str] = ("csv",),
+    prizes: dict = None,
+    shared_changed: List[str] = (),
+    transfer_horizons: List[int] = (1, 3, 5),
+    check_squads: bool = False,
+):
+    """
+    Run the pipeline of one league in its own directory and database.
 
-    with duckdb.connect("drafty.db") as con:
-        if refresh:
-            entries, max_gw, gameweeks = fetch_and_load_static_league_data(
-                con=con, league_code=league_code
+    The league independent data is expected to be fetched already, see
+    fetch_shared_data, so several leagues can run side by side. With
+    check_squads, the squads replayed from the transaction log are checked
+    against the gameweek picks, see calc_squads.
+    """
+    data_dir = data_ingest.league_dir(league_code)
+    os.makedirs(data_dir, exist_ok=True)
+
+    with duckdb.connect(f"{data_dir}/drafty.db") as con:
+        # Without a refresh the raw files tracked in git are loaded as they
+        # are, so the database can be built from a fresh clone
+        entries, max_gw, gameweeks = fetch_and_load_static_league_data(
+            con=con,
+            league_code=league_code,
+            shared_changed=shared_changed,
+            fetch=refresh,
+        )
+        fetch_and_load_live_league_data(
+            con=con,
+            league_code=league_code,
+            entries=entries,
+            gameweeks=gameweeks,
+            incremental=incremental,
+            fetch=refresh,
+        )
+
+        cube_dir = f"{data_dir}/stat_cube"
+        # Names the version of the cube, so it changes whenever the cube does
+        cube_files = [f"{cube_dir}/current"]
+
+        # First gameweek the incremental transforms will reprocess
+        from_gw = processed_gw(con, "total_points") if incremental else None
+        create_transform_state(con)
+
+        nodes = [
+            Node(
+                "concat_team_points",
+                concat_team_points,
+                inputs=["team_history"],
+                outputs=["total_points"],
+                kwargs={"incremental": incremental},
+            ),
+            Node(
+                "calc_bench_pts",
+                calc_bench_pts,
+                inputs=["gw_event", "gw_live", "elements", "league_entries"],
+                outputs=["bench_pts_gw", "bench_pts", "total_bench_pts"],
+                kwargs={"incremental": incremental},
+            ),
+            Node(
+                "calc_blunders",
+                calc_blunders,
+                inputs=["transactions", "gw_live", "elements", "league_entries"],
+                outputs=["blunders"],
+                kwargs={"incremental": incremental},
+            ),
+            Node(
+                "calc_running_standings",
+                calc_running_standings,
+                inputs=["total_points", "league_entries"],
+                outputs=["standings_ts"],
+                kwargs={"incremental": incremental},
+            ),
+            Node(
+                "calc_cumm_points",
+                calc_cumm_points,
+                inputs=["total_points", "league_entries"],
+                outputs=["cumm_points"],
+                kwargs={"incremental": incremental},
+            ),
+            Node(
+                "top_n_transfers",
+                top_n_transfers,
+                inputs=["blunders"],
+                outputs=["transfer_ranks"]
+                + [f"{board}_n_transfers" for board in ["top", "bottom"]]
+                + [
+                    f"{board}_n_transfers_by_{split}"
+                    for board in ["top", "bottom"]
+                    for split in ["team", "kind"]
+                ],
+                kwargs={"k": top_n},
+            ),
+            Node(
+                "calc_points_index",
+                calc_points_index,
+                inputs=["gw_live", "elements"],
+                outputs=["player_points_index"],
+            ),
+            Node(
+                "calc_transfer_horizons",
+                calc_transfer_horizons,
+                inputs=[
+                    "transactions",
+                    "gw_live",
+                    "elements",
+                    "league_entries",
+                    "player_points_index",
+                ],
+                outputs=["transfer_horizons"],
+                kwargs={"horizons": transfer_horizons},
+            ),
+            Node(
+                "build_stat_cube",
+                build_stat_cube,
+                inputs=["gw_live", "elements"],
+                outputs=["stat_cube_index"] + cube_files,
+                kwargs={"cube_dir": cube_dir},
+            ),
+            Node(
+                "calc_autosubs",
+                calc_autosubs,
+                inputs=["gw_event", "gw_subs", "elements", "stat_cube_index"]
+                + cube_files,
+                outputs=["autosubs", "lineup_points"],
+                kwargs={"cube_dir": cube_dir},
+            ),
+            Node(
+                "calc_optimal_lineups",
+                calc_optimal_lineups,
+                inputs=[
+                    "gw_event",
+                    "gw_subs",
+                    "elements",
+                    "stat_cube_index",
+                    "lineup_points",
+                ]
+                + cube_files,
+                outputs=["optimal_lineups"],
+                kwargs={"cube_dir": cube_dir},
+            ),
+        ]
+        if check_squads:
+            nodes.append(
+                Node(
+                    "calc_squads",
+                    calc_squads,
+                    inputs=["choices", "transactions", "status", "gw_event"],
+                    outputs=["squads", "squad_mismatches"],
+                )
             )
-            fetch_and_load_live_league_data(
-                con=con, entries=entries, gameweeks=gameweeks
+        for i in brackets.keys():
+            nodes.append(
+                Node(
+                    f"calc_points_bracket_{i}",
+                    calc_points_bracket,
+                    inputs=["total_points", "league_entries"],
+                    outputs=[f"results_{i}"],
+                    kwargs={"brackets": brackets, "bracket": i, "from_gw": from_gw},
+                )
             )
-        else:
-            # Retrieve entries from the database if not refreshing
-            entries = (
-                con.sql("SELECT DISTINCT entry_id FROM league_entries")
-                .df()["entry_id"]
-                .tolist()
+
+        report = run_dag(con=con, nodes=nodes, max_workers=transform_workers)
+        ran = [name for name, node in report.items() if node["status"] == "ran"]
+        logger.info(
+            f"Transforms: {len(ran)} ran, {len(report) - len(ran)} skipped, "
+            f"{sum(node['seconds'] for node in report.values()):.2f}s total"
+        )
+
+        if export:
+            export_tables(
+                con=con,
+                brackets=brackets,
+                gameweeks=gameweeks,
+                out_dir=data_dir,
+                formats=export_formats,
             )
-            gameweeks = (
-                con.sql("SELECT DISTINCT event FROM status").df()["event"].tolist()
+            export_bundle(
+                con=con,
+                brackets=brackets,
+                prizes=prizes or {},
+                path=f"{data_dir}/bundle.json",
             )
 
-        concat_team_points(con=con, team_ids=entries)
-        calc_bench_pts(con=con)
-
-        for i in gameweeks:
-            calc_blunders(con=con, gw=i)
+    data_metrics.write_report(f"{data_dir}/run_report.json")
 
-        for i in brackets.keys():
-            calc_points_bracket(con=con, brackets=brackets, bracket=i)
 
-        calc_running_standings(con=con)
-        calc_cumm_points(con=con)
-        top_n_transfers(con=con)
+def run_league(ingest: dict, metrics: dict, **kwargs) -> str:
+    """
+    Process pool entry point, configures the ingest and metrics layers of the
+    worker, which may have run another league before.
+    """
+    data_ingest.configure(**ingest)
+    data_metrics.configure(**metrics, run=kwargs["league_code"])
+    data_metrics.reset()
+    data_pipeline(**kwargs)
+    return kwargs["league_code"]
 
 
 def parse_arguments(cli_args: list[str] = None) -> argparse.Namespace:
     parser = argparse.ArgumentParser()
 
     parser.add_argument("--refresh", default=False, type=bool)
+    parser.add_argument("--incremental", default=False, type=bool)
+    parser.add_argument("--skip-export", default=False, type=bool)
+    parser.add_argument("--metrics-sink", default=None, type=str)
+    parser.add_argument("--record", default=None, type=str)
+    parser.add_argument("--replay", default=None, type=str)
+    parser.add_argument("--check-squads", default=False, type=bool)
 
     return parser.parse_args(args=cli_args)
 
@@ -68,23 +260,69 @@ def main(cli_args: List[str]):
     logger.add("app.log", rotation="500 MB")
     args = parse_arguments(cli_args=cli_args)
 
-    refresh = args.refresh
+    # Recording or replaying a snapshot archive runs the whole ingest phase
+    refresh = args.refresh or bool(args.record or args.replay)
 
     # Read the config file
     with open("drafty/config.yaml", "r") as config_file:
         config = yaml.safe_load(config_file)
 
     brackets = config.get("brackets")
-    league_code = config.get("league_code")
+    leagues = data_ingest.config_leagues(config)
+    ingest = config.get("ingest", {})
+    ingest.update(record=args.record, replay=args.replay)
+    data_ingest.configure(**ingest)
+    if args.record:
+        shutil.rmtree(f"{args.record}.parts", ignore_errors=True)
+    metrics = config.get("metrics", {})
+    if args.metrics_sink:
+        metrics["sink"] = args.metrics_sink
+    data_metrics.configure(**metrics, run="shared")
 
-    if not league_code:
-        logger.error("Error: league_code not found in config.yaml")
+    if not all(leagues):
+        logger.error("Error: leagues not found in config.yaml")
         return
 
     # Create directories if they don't exist
-    os.makedirs("drafty/data/gw", exist_ok=True)  # Changed GW to gw
+    os.makedirs(f"{data_ingest.DATA_DIR}/gw", exist_ok=True)
+
+    # League independent data is fetched once, then every league runs in
+    # its own process against its own directory and database
+    shared_changed = []
+    if refresh:
+        shared_changed = fetch_shared_data()
+        data_metrics.write_report(f"{data_ingest.DATA_DIR}/run_report.json")
+    workers = min(config.get("league_workers", 4), len(leagues))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(
+                run_league,
+                ingest,
+                metrics,
+                refresh=refresh,
+                league_code=league_code,
+                brackets=brackets,
+                incremental=args.incremental,
+                export=not args.skip_export,
+                top_n=config.get("top_n", 10),
+                transform_workers=config.get("transform_workers", 4),
+                export_formats=config.get("export_formats", ["csv"]),
+                prizes=config.get("prizes", {}),
+                shared_changed=shared_changed,
+                transfer_horizons=config.get("transfer_horizons", [1, 3, 5]),
+                check_squads=args.check_squads,
+            )
+            for league_code in leagues
+        ]
+        for future in as_completed(futures):
+            logger.info(f"League {future.result()} done")
+
+    # The frontend shows the first league of the config
+    if not args.skip_export:
+        publish_bundle(f"{data_ingest.league_dir(leagues[0])}/bundle.json")
 
-    data_pipeline(refresh=refresh, league_code=league_code, brackets=brackets)
+    if args.record:
+        data_ingest.pack_snapshot(args.record)
 
 
 if __name__ == "__main__":
@@ -1,16 +1,33 @@
 import os
+import shutil
 import duckdb
-import json
-import pandas as pd
 from loguru import logger
 from typing import List
 from data_ingest import (
-    get_static_data,
-    get_league_data,
-    get_team_data,
-    get_gw_team_data,
-    get_gw_data,
+    DATA_DIR,
+    FETCH_SETTINGS,
+    trim_live,
+    league_dir,
+    snapshot_mode,
+    current_gameweek,
+    fetch_batch,
+    load_manifest,
+    save_manifest,
+    is_fresh,
+    record_fetched,
+    finished_gameweeks,
+    static_requests,
+    league_requests,
+    team_requests,
+    gw_team_requests,
+    gw_requests,
 )
+from data_store import RawStore, live_key, explain_key
+from data_metrics import Stage
+
+
+# bootstrap-static.json is a single multi-MB object
+MAX_JSON_OBJECT_SIZE = 256 * 1024**2
 
 
 # Helper function to load JSON data and create table
@@ -20,13 +37,212 @@ def load_json_to_table(
     keys: List[str],
     table_name: str = None,
 ):
-    with open(file_path) as json_data:
-        data = json.load(json_data)
-        for key in keys:
-            df = pd.json_normalize(data[key])  # noqa: F841
-            table = table_name or key
-            logger.info(f"Creating table {table} from {file_path}")
-            con.sql(f"CREATE TABLE IF NOT EXISTS {table} AS SELECT * FROM df")
+    for key in keys:
+        table = table_name or key
+        logger.info(f"Creating table {table} from {file_path}")
+        with Stage("load", table, con=con, table=table) as stage:
+            stage.bytes = os.path.getsize(file_path)
+            con.sql(
+                f"""
+                CREATE OR REPLACE TABLE {table} AS
+                SELECT unnest({key}, recursive := true)
+                FROM read_json('{file_path}', maximum_object_size={MAX_JSON_OBJECT_SIZE})
+                """
+            )
+
+
+def load_gw_live(con: duckdb.DuckDBPyConnection, gameweeks: List[int]) -> None:
+    """
+    Load the live data of every gameweek from the raw store into gw_live, one
+    row per (id, gw).
+
+    The column wise stats written by trim_live are zipped back into one JSON
+    object per element in a single read_json pass, their schema is inferred
+    with json_group_structure and then applied with json_transform so every
+    stat becomes a typed column.
+    """
+    store = RawStore()
+    files = {gw: store.get(live_key(gw)) for gw in gameweeks}
+    logger.info(f"Creating table gw_live from {len(files)} objects in {store.root}")
+    con.sql(
+        f"""
+        CREATE OR REPLACE TEMP TABLE gw_live_raw AS
+        SELECT
+            f.gw,
+            element.key::INTEGER AS id,
+            to_json(map_from_entries(list_zip(names, element.value))) AS stats
+        FROM (
+            SELECT filename, stats AS names, unnest(map_entries(elements)) AS element
+            FROM read_json(
+                {sorted(set(files.values()))},
+                columns={{'stats': 'VARCHAR[]', 'elements': 'MAP(VARCHAR, JSON[])'}},
+                filename=true,
+                maximum_object_size={MAX_JSON_OBJECT_SIZE}
+            )
+        )
+        -- Gameweeks with identical payloads share an object
+        JOIN (
+            SELECT unnest({list(files.values())}) AS filename,
+                unnest({list(files)}) AS gw
+        ) f USING (filename)
+        """
+    )
+    structure = con.sql("SELECT json_group_structure(stats) FROM gw_live_raw")
+    # Counts are inferred as UBIGINT/HUGEINT, keep them as plain integers
+    structure = (
+        structure.fetchone()[0]
+        .replace("UBIGINT", "BIGINT")
+        .replace("HUGEINT", "BIGINT")
+    )
+    con.sql(
+        f"""
+        CREATE OR REPLACE TABLE gw_live AS
+        SELECT unnest(json_transform(stats, '{structure}')), id, gw
+        FROM gw_live_raw
+        """
+    )
+    con.sql("DROP TABLE gw_live_raw")
+
+
+def load_gw_explain(con: duckdb.DuckDBPyConnection, gameweeks: List[int]) -> None:
+    """
+    Load the per fixture points breakdown kept with ingest.keep_explain into
+    gw_explain, one row per (element, fixture, stat, gw).
+    """
+    store = RawStore()
+    files = {
+        gw: store.get(explain_key(gw))
+        for gw in gameweeks
+        if explain_key(gw) in store.index
+    }
+    if not files:
+        return
+
+    logger.info(f"Creating table gw_explain from {len(files)} objects in {store.root}")
+    con.sql(
+        f"""
+        CREATE OR REPLACE TABLE gw_explain AS
+        SELECT
+            (r ->> 0)::INTEGER AS element,
+            (r ->> 1)::INTEGER AS fixture,
+            r ->> 2 AS stat,
+            (r ->> 3)::INTEGER AS points,
+            (r ->> 4)::INTEGER AS value,
+            f.gw
+        FROM (
+            SELECT filename, unnest(explain) AS r
+            FROM read_json(
+                {sorted(set(files.values()))},
+                columns={{'explain': 'JSON[]'}},
+                filename=true,
+                maximum_object_size={MAX_JSON_OBJECT_SIZE}
+            )
+        )
+        JOIN (
+            SELECT unnest({list(files.values())}) AS filename,
+                unnest({list(files)}) AS gw
+        ) f USING (filename)
+        """
+    )
+
+
+def load_team_history(
+    con: duckdb.DuckDBPyConnection, entries: List[int], data_dir: str
+) -> None:
+    """Load every team_{id}/history.json into team_history, keyed by (entry_id, gw)."""
+    files = [f"{data_dir}/team_{team_id}/history.json" for team_id in entries]
+    logger.info(f"Creating table team_history from {data_dir}/team_*/history.json")
+    con.sql(
+        """
+        CREATE OR REPLACE TABLE team_history (
+            entry_id INTEGER,
+            gw INTEGER,
+            id INTEGER,
+            points INTEGER,
+            total_points INTEGER,
+            event_transfers INTEGER,
+            points_on_bench INTEGER,
+            PRIMARY KEY (entry_id, gw)
+        )
+        """
+    )
+    con.sql(
+        f"""
+        INSERT INTO team_history
+        SELECT
+            h.entry,
+            h.event,
+            h.id,
+            h.points,
+            h.total_points,
+            h.event_transfers,
+            h.points_on_bench
+        FROM (
+            SELECT unnest(history) AS h
+            FROM read_json(
+                {files},
+                columns={{
+                    'history': 'STRUCT(
+                        id INTEGER,
+                        points INTEGER,
+                        total_points INTEGER,
+                        event_transfers INTEGER,
+                        points_on_bench INTEGER,
+                        entry INTEGER,
+                        event INTEGER
+                    )[]'
+                }}
+            )
+        )
+        """
+    )
+
+
+def load_gw_event(
+    con: duckdb.DuckDBPyConnection, entries: List[int], data_dir: str
+) -> None:
+    """
+    Load every team_{id}/{gw}_event.json into gw_event, one row per pick, and
+    the automatic substitutions the game applied into gw_subs.
+
+    The picks of a finished gameweek are in their positions after those
+    substitutions.
+    """
+    files = [f"{data_dir}/team_{team_id}/*_event.json" for team_id in entries]
+    logger.info(f"Creating table gw_event from {data_dir}/team_*/*_event.json")
+    con.sql(
+        f"""
+        CREATE OR REPLACE TEMP TABLE gw_event_raw AS
+        SELECT
+            picks,
+            subs,
+            regexp_extract(filename, '(\\d+)_event\\.json$', 1)::INTEGER AS gw,
+            regexp_extract(filename, 'team_(\\d+)', 1)::INTEGER AS team_id
+        FROM read_json(
+            {files},
+            columns={{
+                'picks': 'STRUCT(element INTEGER, position INTEGER)[]',
+                'subs': 'STRUCT(element_in INTEGER, element_out INTEGER)[]'
+            }},
+            filename=true
+        )
+        """
+    )
+    con.sql(
+        """
+        CREATE OR REPLACE TABLE gw_subs AS
+        SELECT sub.element_in, sub.element_out, gw, team_id
+        FROM (SELECT unnest(subs) AS sub, gw, team_id FROM gw_event_raw)
+        """
+    )
+    con.sql(
+        """
+        CREATE OR REPLACE TABLE gw_event AS
+        SELECT pick.element, pick.position, gw, team_id
+        FROM (SELECT unnest(picks) AS pick, gw, team_id FROM gw_event_raw)
+        """
+    )
+    con.sql("DROP TABLE gw_event_raw")
 
 
 def get_details(
@@ -46,43 +262,120 @@ def get_details(
     """
     results = con.sql("SELECT DISTINCT entry_id FROM league_entries").df()
     gw = con.sql("SELECT DISTINCT event FROM status").df()
+    data_dir = league_dir(league_code)
 
-    with open(r"drafty/data_gw", "w") as fp:
+    with open(f"{data_dir}/data_gw", "w") as fp:
         fp.writelines(gw["event"].astype(str).to_list())
 
-    with open(r"drafty/data_teams", "w") as fp:
+    with open(f"{data_dir}/data_teams", "w") as fp:
         fp.write("\n".join(results["entry_id"].astype(str).to_list()))
 
     return results["entry_id"].to_list(), gw["event"].to_list()
 
 
+def store_live(
+    store: RawStore, gw: int, file: str, finished: bool, keep_explain: bool
+) -> None:
+    """Trim a fetched live payload and move it, and its explain rows, into store."""
+    explain_file = f"{file}.explain" if keep_explain else None
+    trim_live(file, explain_file=explain_file)
+    store.put(live_key(gw), file, gw=gw, finished=finished, trimmed=True)
+    if explain_file:
+        store.put(explain_key(gw), explain_file, gw=gw)
+
+
+def fetch_shared_data() -> List[str]:
+    """
+    Fetch the league independent resources once for every league.
+
+    These are the static game data in DATA_DIR and the live data of every
+    gameweek up to the current one, which is kept in the raw store. A finished
+    gameweek whose stored payload passes its integrity check is never fetched
+    again, unless a snapshot is recorded or replayed.
+
+    Returns:
+        List[str]: The static files that were (re)written.
+    """
+    changed = fetch_batch(static_requests())
+
+    store = RawStore()
+    finished = finished_gameweeks()
+    keep_explain = FETCH_SETTINGS["keep_explain"]
+    gameweeks = range(1, current_gameweek() + 1)
+
+    # Payloads stored before trimming was added are trimmed from the stored copy
+    for gw in gameweeks:
+        entry = store.index.get(live_key(gw))
+        if entry and not entry.get("trimmed") and store.verify(live_key(gw)):
+            for file, _ in gw_requests(gw=gw):
+                shutil.copyfile(store.get(live_key(gw)), file)
+                store_live(store, gw, file, entry["finished"], keep_explain)
+
+    gw_batches = [
+        (gw, gw_requests(gw=gw))
+        for gw in gameweeks
+        if snapshot_mode()
+        or not (
+            store.index.get(live_key(gw), {}).get("finished")
+            and store.verify(live_key(gw))
+            and (explain_key(gw) in store.index or not keep_explain)
+        )
+    ]
+    logger.info(f"Raw store: {len(gw_batches)} live gameweeks to fetch")
+
+    # Live data moves into the raw store, so it is kept out of the response cache
+    fetch_batch([req for _, reqs in gw_batches for req in reqs], cache_index=None)
+    for gw, reqs in gw_batches:
+        for file, _ in reqs:
+            if os.path.exists(file):
+                store_live(store, gw, file, gw in finished, keep_explain)
+    store.gc()
+    store.save()
+
+    return changed
+
+
 def fetch_and_load_static_league_data(
     con: duckdb.DuckDBPyConnection,
     league_code: str,
+    shared_changed: List[str] = (),
+    fetch: bool = True,
 ) -> tuple[List[int], List[int], List[int]]:
     """
-    Retrieve static and league-specific data.
+    Retrieve league-specific data and load it with the shared static data.
 
     Args:
-        con (duckdb.DuckDBPyConnection): DuckDB connection object.
+        con (duckdb.DuckDBPyConnection): DuckDB connection of the league.
         league_code (str): Code of the league to retrieve data for.
+        shared_changed (List[str]): Shared files rewritten by fetch_shared_data.
+        fetch (bool): Fetch the league files first. Otherwise the files on
+            disk are loaded into the tables that are missing.
 
     Returns:
         None
     """
-    # Fetch static and league data
-    get_static_data()
-    get_league_data(league_code=league_code)
+    data_dir = league_dir(league_code)
+    changed = list(shared_changed)
+    if fetch:
+        changed += fetch_batch(
+            league_requests(league_code=league_code),
+            cache_index=f"{data_dir}/http_cache.json",
+        )
+    tables = set(con.sql("SELECT table_name FROM duckdb_tables()").df()["table_name"])
 
     # Load main data files
     data_files = {
-        "drafty/data/details.json": ["league_entries", "league", "standings"],
-        "drafty/data/event-status.json": ["status"],
-        "drafty/data/bootstrap-static.json": ["elements"],
-        "drafty/data/transactions.json": ["transactions"],
+        f"{data_dir}/details.json": ["league_entries", "league", "standings"],
+        f"{DATA_DIR}/event-status.json": ["status"],
+        f"{DATA_DIR}/bootstrap-static.json": ["elements"],
+        f"{data_dir}/transactions.json": ["transactions"],
+        f"{data_dir}/choices.json": ["choices"],
     }
 
     for file_path, keys in data_files.items():
+        if file_path not in changed and tables.issuperset(keys):
+            logger.info(f"{file_path} not modified, keeping tables {keys}")
+            continue
         load_json_to_table(con=con, file_path=file_path, keys=keys)
 
     # Get entry IDs and gameweeks
@@ -96,78 +389,88 @@ def fetch_and_load_static_league_data(
     return entries, max_gw, gameweeks
 
 
+def fetch_live_league_files(
+    league_code: str,
+    entries: List[int],
+    gameweeks: List[int],
+    incremental: bool = False,
+) -> None:
+    """
+    Fetch the team files of a league, skipping with incremental the gameweek
+    files already fetched after their gameweek finished.
+    """
+    data_dir = league_dir(league_code)
+    manifest_file = f"{data_dir}/manifest.json"
+    manifest = load_manifest(manifest_file)
+    finished = finished_gameweeks()
+
+    # Queue team and team gameweek requests as one batch
+    batch = []
+    gw_batches = []
+    for team_id in entries:
+        batch += team_requests(team_id=team_id, data_dir=data_dir)
+        for gw in gameweeks:
+            reqs = gw_team_requests(team_id=team_id, gw=gw, data_dir=data_dir)
+            gw_batches.append((gw, reqs))
+
+    if incremental and not snapshot_mode():
+        gw_batches = [
+            (gw, reqs)
+            for gw, reqs in gw_batches
+            if not all(is_fresh(manifest, file) for file, _ in reqs)
+        ]
+        logger.info(f"Incremental ingest: {len(gw_batches)} gameweek files to fetch")
+
+    for _, reqs in gw_batches:
+        batch += reqs
+
+    fetch_batch(batch, cache_index=f"{data_dir}/http_cache.json")
+
+    for gw, reqs in gw_batches:
+        record_fetched(manifest, reqs, gw=gw, finished=gw in finished)
+    save_manifest(manifest, manifest_file)
+
+
 def fetch_and_load_live_league_data(
     con: duckdb.DuckDBPyConnection,
+    league_code: str,
     entries: List[int],
     gameweeks: List[int],
+    incremental: bool = False,
+    fetch: bool = True,
 ) -> None:
     """
     Load data from JSON files into the database.
 
+    The live gameweek files are fetched once for all leagues by
+    fetch_shared_data, only the team files are fetched here.
+
     Args:
-        con (duckdb.DuckDBPyConnection): DuckDB connection object.
+        con (duckdb.DuckDBPyConnection): DuckDB connection of the league.
+        league_code (str): Code of the league the entries belong to.
+        incremental (bool): Skip gameweek files already fetched after their
+            gameweek finished, according to the league manifest. Ignored when
+            a snapshot is recorded or replayed.
+        fetch (bool): Fetch the team files first. Otherwise only the files
+            on disk and in the raw store are loaded.
 
     Returns:
         None
     """
-    for team_id in entries:
-        get_team_data(team_id=team_id)
-        for gw in gameweeks:
-            get_gw_team_data(team_id=team_id, gw=gw)
-
-    # Fetch gameweek data
-    for gw in gameweeks:
-        get_gw_data(gw=gw)
-
-    # Load team history data
-    for entry in os.listdir("drafty/data"):
-        if entry.startswith("team_"):
-            history_file = f"drafty/data/{entry}/history.json"
-            logger.info(f"Loading history data for {entry} - , {history_file}")
-            load_json_to_table(con, history_file, ["history"], table_name=entry)
-            # Drop specific columns and save as CSV
-            history_df = pd.read_sql(f"SELECT * FROM {entry}", con)
-            history_df = history_df.drop(["rank", "rank_sort"], axis=1)
-            history_df.to_csv(f"drafty/data/{entry}/history.csv", index=False)
-
-    # Load gameweek live data
-    gw_live_data = []
-    for file in os.listdir("drafty/data/gw"):
-        if file.endswith(".json"):
-            with open(f"drafty/data/gw/{file}") as json_data:
-                data = json.load(json_data)
-                gw = file.split("_")[0]
-                for element_id, element_data in data["elements"].items():
-                    row = element_data["stats"]
-                    row["id"] = element_id
-                    row["gw"] = gw
-                    gw_live_data.append(row)
-
-    gw_live_df = pd.DataFrame(gw_live_data)
-    gw_live_df.to_csv("drafty/data/gw_live.csv", index=False)
-    con.sql(
-        "CREATE TABLE IF NOT EXISTS gw_live AS FROM read_csv('drafty/data/gw_live.csv', auto_detect=TRUE)"
-    )
+    data_dir = league_dir(league_code)
+    if fetch:
+        fetch_live_league_files(
+            league_code=league_code,
+            entries=entries,
+            gameweeks=gameweeks,
+            incremental=incremental,
+        )
 
-    # Load gameweek event data
-    gw_event_data = []
-    for team_id in entries:
-        team_dir = f"drafty/data/team_{team_id}"
-        for file in os.listdir(team_dir):
-            if file.endswith("event.json"):
-                with open(f"{team_dir}/{file}") as json_data:
-                    data = json.load(json_data)
-                    gw = file.split("_")[0]
-                    for pick in data["picks"]:
-                        pick["gw"] = gw
-                        pick["team_id"] = team_id
-                        gw_event_data.append(pick)
-
-    gw_event_df = pd.DataFrame(gw_event_data)
-    gw_event_df = gw_event_df.drop(
-        ["is_captain", "is_vice_captain", "multiplier"], axis=1
-    )
-    gw_event_df.to_csv("drafty/data/gw_event.csv", index=False)
-    con.sql(
-        "CREATE TABLE IF NOT EXISTS gw_event AS FROM read_csv('drafty/data/gw_event.csv', auto_detect=TRUE)"
-    )
+    with Stage("load", "team_history", con=con, table="team_history"):
+        load_team_history(con=con, entries=entries, data_dir=data_dir)
+    with Stage("load", "gw_live", con=con, table="gw_live"):
+        load_gw_live(con=con, gameweeks=gameweeks)
+    with Stage("load", "gw_explain", con=con):
+        load_gw_explain(con=con, gameweeks=gameweeks)
+    with Stage("load", "gw_event", con=con, table="gw_event"):
+        load_gw_event(con=con, entries=entries, data_dir=data_dir)
@@ -0,0 +1,94 @@
+import hashlib
+import json
+import os
+from datetime import datetime, timezone
+from loguru import logger
+
+STORE_DIR = "drafty/data/store"
+
+
+def live_key(gw) -> str:
+    return f"event/{gw}/live"
+
+
+def explain_key(gw) -> str:
+    return f"event/{gw}/explain"
+
+
+class RawStore:
+    """
+    Content addressed store of raw API payloads shared by every league.
+
+    Payloads are stored once under objects/ by the sha256 of their bytes, and
+    index.json maps a resource key such as "event/{gw}/live" to its digest
+    and metadata. Identical payloads are kept once whatever their key, and
+    every read can check the object still matches its digest.
+    """
+
+    def __init__(self, root: str = STORE_DIR):
+        self.root = root
+        self.index_file = f"{root}/index.json"
+        self.index = {}
+        if os.path.exists(self.index_file):
+            with open(self.index_file) as fp:
+                self.index = json.load(fp)
+
+    def object_path(self, digest: str) -> str:
+        return f"{self.root}/objects/{digest[:2]}/{digest}.json"
+
+    @staticmethod
+    def digest(path: str) -> str:
+        sha = hashlib.sha256()
+        with open(path, "rb") as fp:
+            for chunk in iter(lambda: fp.read(1024**2), b""):
+                sha.update(chunk)
+        return sha.hexdigest()
+
+    def put(self, key: str, file: str, **meta) -> str:
+        """Move file into the store under key and return its digest."""
+        digest = self.digest(file)
+        path = self.object_path(digest)
+        if os.path.exists(path):
+            os.remove(file)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(file, path)
+        self.index[key] = {
+            "sha256": digest,
+            "size": os.path.getsize(path),
+            "stored_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            **meta,
+        }
+        return digest
+
+    def verify(self, key: str) -> bool:
+        """True if key is stored and its object still matches the digest."""
+        entry = self.index.get(key)
+        if not entry:
+            return False
+        path = self.object_path(entry["sha256"])
+        return os.path.exists(path) and self.digest(path) == entry["sha256"]
+
+    def get(self, key: str) -> str:
+        """Path of the object stored under key, after an integrity check."""
+        if not self.verify(key):
+            raise ValueError(f"{key} is missing or corrupt in {self.root}")
+        return self.object_path(self.index[key]["sha256"])
+
+    def gc(self) -> int:
+        """Delete objects no key refers to, returning how many were removed."""
+        referenced = {entry["sha256"] for entry in self.index.values()}
+        removed = 0
+        for dir_path, _, files in os.walk(f"{self.root}/objects"):
+            for file in files:
+                if file.removesuffix(".json") not in referenced:
+                    os.remove(os.path.join(dir_path, file))
+                    removed += 1
+        if removed:
+            logger.info(f"Removed {removed} unreferenced objects from {self.root}")
+        return removed
+
+    def save(self) -> None:
+        os.makedirs(self.root, exist_ok=True)
+        with open(self.index_file, "w") as fp:
+            json.dump(self.index, fp, indent=1, sort_keys=True)
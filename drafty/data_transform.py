@@ -1,7 +1,79 @@
 import os
-import pandas as pd
+import json
+import shutil
+from datetime import datetime, timezone
 from loguru import logger
 from jinja2 import Template
+from data_metrics import Stage
+
+# Tables exported by export_tables, mapped to their file name in drafty/data.
+# The raw gw_live and gw_event fact tables stay in drafty.db.
+EXPORTS = {
+    "total_points": "joined",
+    "bench_pts": "bench_pts",
+    "total_bench_pts": "total_bench_pts",
+    "standings_ts": "standings_ts",
+    "cumm_points": "cumm_points",
+    "top_n_transfers": "top_df",
+    "bottom_n_transfers": "bottom_df",
+    "top_n_transfers_by_team": "top_by_team",
+    "bottom_n_transfers_by_team": "bottom_by_team",
+    "top_n_transfers_by_kind": "top_by_kind",
+    "bottom_n_transfers_by_kind": "bottom_by_kind",
+}
+
+# Export formats, mapped to their file extension and COPY options
+EXPORT_FORMATS = {
+    "csv": ("csv", "HEADER, DELIMITER ','"),
+    "parquet": ("parquet", "FORMAT PARQUET, COMPRESSION ZSTD"),
+}
+
+# Schema version of the frontend data bundle, bumped on breaking layout changes
+BUNDLE_VERSION = 1
+
+# Directory the Next.js frontend serves its data files from
+PUBLIC_DATA_DIR = "public/data"
+
+# String columns of the transfer tables, mapped to the dictionary encoding them
+TRANSFER_DICTIONARIES = {
+    "team": "teams",
+    "waiver_or_free": "kinds",
+    "player_in": "players",
+    "player_out": "players",
+}
+
+# Tables in the frontend data bundle, as (query, dictionary encoded columns)
+BUNDLE_TABLES = {
+    "standings_ts": (
+        "SELECT name, gw, pos FROM standings_ts ORDER BY gw, pos",
+        {"name": "managers"},
+    ),
+    "top_n_transfers": ("SELECT * FROM top_n_transfers", TRANSFER_DICTIONARIES),
+    "bottom_n_transfers": ("SELECT * FROM bottom_n_transfers", TRANSFER_DICTIONARIES),
+    "blunders": (
+        "SELECT * EXCLUDE (transaction_id) FROM blunders "
+        "ORDER BY gw, net_pts, transaction_id",
+        TRANSFER_DICTIONARIES,
+    ),
+    "total_bench_pts": (
+        "SELECT * FROM total_bench_pts ORDER BY bench_pts",
+        {"name": "managers"},
+    ),
+    "bench_pts": (
+        "SELECT * FROM bench_pts ORDER BY name, player_type",
+        {"name": "managers", "player_type": "positions"},
+    ),
+}
+
+# Rank columns of transfer_ranks, dropped from the exported leaderboards
+RANK_COLUMNS = [
+    "best_rank",
+    "worst_rank",
+    "team_best_rank",
+    "team_worst_rank",
+    "kind_best_rank",
+    "kind_worst_rank",
+]
 
 
 def read_sql_template(file_name):
@@ -10,96 +82,331 @@ def read_sql_template(file_name):
         return sql_file.read()
 
 
-def concat_team_points(con, team_ids):
-    sql_template = read_sql_template("concat_team_points.sql")
-    template = Template(sql_template)
-    sql_query = template.render(team_ids=team_ids)
-    joined = con.sql(sql_query).df()
-    joined.to_csv("drafty/data/joined.csv", index=False)
+def create_table(con, table, sql_query):
+    with Stage("transform", table, con=con, table=table):
+        con.sql(f"CREATE OR REPLACE TABLE {table} AS {sql_query}")
+    logger.info(f"Created table {table}")
+
+
+def create_transform_state(con):
+    con.sql(
+        """
+        CREATE TABLE IF NOT EXISTS transform_state (
+            table_name VARCHAR PRIMARY KEY,
+            max_gw INTEGER,
+            updated_at TIMESTAMP
+        )
+        """
+    )
+
+
+def processed_gw(con, table):
+    """Last gameweek upserted into table, or None if it has to be built in full."""
+    create_transform_state(con)
+    state = con.execute(
+        """
+        SELECT s.max_gw
+        FROM transform_state s
+        JOIN duckdb_tables() t ON t.table_name = s.table_name
+        WHERE s.table_name = ?
+        """,
+        [table],
+    ).fetchone()
+    return state[0] if state else None
+
+
+def upsert_gameweeks(con, table, template_name, incremental, lag=0):
+    """
+    Materialise a gameweek keyed transform, optionally only from the last
+    processed gameweek onwards.
+
+    The last processed gameweek is recomputed as well, since it may have still
+    been live on the previous run, and a table whose columns changed since it
+    was built is rebuilt in full. A table whose rows are keyed `lag`
+    gameweeks before the gameweek they are scored on restarts `lag`
+    gameweeks earlier, so the rows scored on that gameweek are refreshed too.
+    """
+    template = Template(read_sql_template(template_name))
+    from_gw = processed_gw(con, table) if incremental else None
+    # A table built before its columns changed is rebuilt in full
+    if from_gw is not None and (
+        con.sql(f"SELECT * FROM {table} LIMIT 0").columns
+        != con.sql(f"{template.render(from_gw=None)} LIMIT 0").columns
+    ):
+        from_gw = None
+    if from_gw is not None:
+        from_gw -= lag
+    sql_query = template.render(from_gw=from_gw)
+
+    if from_gw is None:
+        create_table(con, table, sql_query)
+    else:
+        with Stage("transform", table, con=con) as stage:
+            con.sql(f"DELETE FROM {table} WHERE gw >= {from_gw}")
+            stage.rows = con.execute(
+                f"INSERT INTO {table} BY NAME {sql_query}"
+            ).fetchone()[0]
+        logger.info(f"Upserted table {table} from gameweek {from_gw}")
+
+    create_transform_state(con)
     con.sql(
-        "CREATE TABLE IF NOT EXISTS total_points AS FROM read_csv('drafty/data/joined.csv', auto_detect = TRUE);"
+        f"""
+        INSERT OR REPLACE INTO transform_state
+        SELECT '{table}', MAX(gw), now() FROM {table}
+        """
     )
-    logger.info(f"Concatenated points data for {len(team_ids)} teams")
 
 
-def calc_points_bracket(con, brackets, bracket):
+def concat_team_points(con, incremental=False):
+    upsert_gameweeks(con, "total_points", "concat_team_points.sql", incremental)
+
+
+def calc_points_bracket(con, brackets, bracket, from_gw=None):
+    # Brackets that ended before the first reprocessed gameweek cannot change
+    if from_gw is not None and int(brackets[bracket][1]) < from_gw:
+        exists = con.execute(
+            "SELECT count(*) FROM duckdb_tables() WHERE table_name = ?",
+            [f"results_{bracket}"],
+        ).fetchone()[0]
+        if exists:
+            return
+
     sql_template = read_sql_template("calc_points_bracket.sql")
     template = Template(sql_template)
     sql_query = template.render(
         start_gw=brackets[bracket][0], end_gw=brackets[bracket][1]
     )
+    create_table(con, f"results_{bracket}", sql_query)
 
-    results = con.sql(sql_query).df()
-    results.to_csv(f"drafty/data/results_{bracket}.csv", index=False)
 
+def calc_running_standings(con, incremental=False):
+    # Ranks are partitioned by gameweek, so new gameweeks never re-rank old ones
+    upsert_gameweeks(con, "standings_ts", "calc_running_standings.sql", incremental)
 
-def calc_running_standings(con):
-    sql_query = read_sql_template("calc_running_standings.sql")
-    standings_ts = con.sql(sql_query).df()
-    standings_ts.to_csv("drafty/data/standings_ts.csv", index=False)
-    con.sql(
-        "CREATE TABLE IF NOT EXISTS standings_ts AS FROM read_csv('drafty/data/standings_ts.csv', auto_detect = TRUE);"
-    )
 
+def calc_cumm_points(con, incremental=False):
+    upsert_gameweeks(con, "cumm_points", "calc_cumm_points.sql", incremental)
 
-def calc_cumm_points(con):
-    sql_query = read_sql_template("calc_cumm_points.sql")
-    cumm_points = con.sql(sql_query).df()
-    cumm_points.to_csv("drafty/data/cumm_points.csv", index=False)
-    con.sql(
-        "CREATE TABLE IF NOT EXISTS cumm_points AS FROM read_csv('drafty/data/cumm_points.csv', auto_detect = TRUE);"
-    )
 
+def calc_blunders(con, incremental=False):
+    """
+    Transfer outcomes for every gameweek, keyed by the transfer gameweek `gw`
+    and scored on the gameweek after it.
+    """
+    upsert_gameweeks(con, "blunders", "calc_blunders.sql", incremental, lag=1)
 
-def calc_blunders(con, gw):
-    sql_template = read_sql_template("calc_blunders.sql")
-    template = Template(sql_template)
-    sql_query = template.render(gw=gw)
 
-    blunders = con.sql(sql_query).df()
-    blunders.to_csv(f"drafty/data/blunders_{gw}.csv", index=False)
-    con.sql(
-        f"CREATE TABLE IF NOT EXISTS blunders_{gw} AS FROM read_csv('drafty/data/blunders_{gw}.csv', auto_detect = TRUE);"
-    )
+def top_n_transfers(con, k=10):
+    """
+    Best and worst k transfers overall, per team and per kind (waiver or free).
 
+    All rankings come from a single window pass over blunders into
+    transfer_ranks, which keeps only rows inside at least one top k. The
+    leaderboards are then cheap filters on that table.
+    """
+    sql_template = read_sql_template("calc_transfer_ranks.sql")
+    template = Template(sql_template)
+    create_table(con, "transfer_ranks", template.render(k=k))
 
-def top_n_transfers(con):
-    df_list = []
+    leaderboards = {
+        "top_n_transfers": ("best_rank", None),
+        "bottom_n_transfers": ("worst_rank", None),
+        "top_n_transfers_by_team": ("team_best_rank", "team"),
+        "bottom_n_transfers_by_team": ("team_worst_rank", "team"),
+        "top_n_transfers_by_kind": ("kind_best_rank", "waiver_or_free"),
+        "bottom_n_transfers_by_kind": ("kind_worst_rank", "waiver_or_free"),
+    }
+    exclude = ", ".join(["gw", "transaction_id"] + RANK_COLUMNS)
+    for table, (rank, partition) in leaderboards.items():
+        columns, order = f"* EXCLUDE ({exclude})", rank
+        if partition:
+            columns += f", {rank} AS rank"
+            order = f"{partition}, {rank}"
+        create_table(
+            con,
+            table,
+            f"SELECT {columns} FROM transfer_ranks WHERE {rank} <= {k} ORDER BY {order}",
+        )
 
-    for file in os.listdir("drafty/data/."):
-        if file.startswith("blunders"):
-            df = pd.read_csv(f"drafty/data/{file}")
-            df_list.append(df)
 
-    df_stacked = pd.concat(df_list)
-    df_stacked["net_pts"] = pd.to_numeric(df_stacked["net_pts"])
+def calc_points_index(con):
+    """
+    Cumulative points of every player, as one list per player indexed by
+    gameweek, so the points over any gameweek range are two list lookups.
+    """
+    create_table(con, "player_points_index", read_sql_template("calc_points_index.sql"))
 
-    top_df = df_stacked.nlargest(10, "net_pts")
-    top_df.to_csv("drafty/data/top_df.csv", index=False)
 
-    con.sql(
-        "CREATE TABLE IF NOT EXISTS top_n_transfers AS FROM read_csv('drafty/data/top_df.csv', auto_detect = TRUE);"
-    )
+def calc_transfer_horizons(con, horizons=(1, 3, 5)):
+    """
+    Transfer outcomes over several horizons, one row per transfer and horizon.
 
-    bottom_df = df_stacked.nsmallest(10, "net_pts")
-    bottom_df.to_csv("drafty/data/bottom_df.csv", index=False)
+    Every horizon counts the points of player_in and player_out from the
+    transfer gameweek, the first one player_in is in the squad, up to the
+    gameweek before the team dropped player_in again: at most that many
+    gameweeks for a horizon in horizons, and all of them for `held`. Points
+    come from player_points_index lookups. next_gw and last_gw are the first
+    and last gameweek counted.
+    """
+    template = Template(read_sql_template("calc_transfer_horizons.sql"))
+    create_table(con, "transfer_horizons", template.render(horizons=horizons))
 
-    con.sql(
-        "CREATE TABLE IF NOT EXISTS bottom_n_transfers AS FROM read_csv('drafty/data/bottom_df.csv', auto_detect = TRUE);"
-    )
 
+def calc_bench_pts(con, incremental=False):
+    # Per gameweek differences are upserted, the season totals re-aggregated
+    upsert_gameweeks(con, "bench_pts_gw", "calc_bench_points_gw.sql", incremental)
 
-def calc_bench_pts(con):
     sql_query = read_sql_template("calc_bench_points.sql")
-    bench_pts = con.sql(sql_query).df()
-    bench_pts.to_csv("drafty/data/bench_pts.csv", index=False)
-    con.sql(
-        "CREATE TABLE IF NOT EXISTS bench_pts AS FROM read_csv('drafty/data/bench_pts.csv', auto_detect = TRUE);"
-    )
+    create_table(con, "bench_pts", sql_query)
 
     grp_sql = read_sql_template("calc_total_bench_pts.sql")
-    total_bench_pts = con.sql(grp_sql).df()
-    total_bench_pts.to_csv("drafty/data/total_bench_pts.csv", index=False)
-    con.sql(
-        "CREATE TABLE IF NOT EXISTS total_bench_pts AS FROM read_csv('drafty/data/total_bench_pts.csv', auto_detect = TRUE);"
+    create_table(con, "total_bench_pts", grp_sql)
+
+
+def calc_squads(con):
+    """
+    Squads of every manager per gameweek, replayed from the transaction log.
+
+    The draft picks in choices and the accepted waivers and free agents in
+    transactions are turned into +1/-1 ownership changes per (entry, element,
+    gw), and a running sum over them gives who holds whom in each gameweek,
+    in a single window pass. Trades are not in either log.
+
+    The replayed squads are checked against the picks in gw_event wherever
+    those were fetched. squad_mismatches holds every element in only one of
+    the two, e.g. because of a trade.
+    """
+    create_table(con, "squads", read_sql_template("calc_squads.sql"))
+    create_table(
+        con, "squad_mismatches", read_sql_template("calc_squad_mismatches.sql")
     )
+
+    mismatches = con.sql(
+        "SELECT count(DISTINCT (team_id, gw)) FROM squad_mismatches"
+    ).fetchone()[0]
+    if mismatches:
+        logger.warning(
+            f"{mismatches} squads replayed from the transaction log differ from "
+            "their gameweek picks, see squad_mismatches"
+        )
+
+
+def export_tables(con, brackets, gameweeks, out_dir="drafty/data", formats=("csv",)):
+    """
+    Export the transform tables for the apps and the frontend.
+
+    This is a separate step from the transforms, which only materialise
+    DuckDB tables, so it can be skipped when nothing reads the files. Every
+    table is written once per format in EXPORT_FORMATS that is requested, e.g.
+    csv for the frontend and typed, zstd compressed parquet for the apps.
+    """
+    exports = dict(EXPORTS)
+    exports.update({f"results_{bracket}": f"results_{bracket}" for bracket in brackets})
+    # Per gameweek blunders files are slices of the blunders fact table
+    for gw in gameweeks:
+        blunders_gw = (
+            f"SELECT * EXCLUDE (gw, transaction_id) FROM blunders WHERE gw = {gw} "
+            "ORDER BY net_pts, transaction_id"
+        )
+        exports[f"({blunders_gw})"] = f"blunders_{gw}"
+
+    for export_format in formats:
+        extension, options = EXPORT_FORMATS[export_format]
+        for table, file_name in exports.items():
+            path = f"{out_dir}/{file_name}.{extension}"
+            with Stage("export", path, con=con) as stage:
+                stage.rows = con.execute(
+                    f"COPY {table} TO '{path}' ({options})"
+                ).fetchone()[0]
+                stage.bytes = os.path.getsize(path)
+        logger.info(f"Exported {len(exports)} tables as {export_format} to {out_dir}")
+
+
+def encode_columns(con, query, dictionary_columns, dictionaries):
+    """
+    Column oriented encoding of a query result.
+
+    Columns in dictionary_columns are stored as integer codes into the shared
+    dictionaries, which are extended in first seen order. Other columns are
+    stored as plain value arrays.
+    """
+    result = con.sql(query)
+    rows = result.fetchall()
+    columns = {}
+    for i, column in enumerate(result.columns):
+        values = [row[i] for row in rows]
+        dictionary_name = dictionary_columns.get(column)
+        if dictionary_name:
+            dictionary = dictionaries.setdefault(dictionary_name, {})
+            values = {
+                "dictionary": dictionary_name,
+                "codes": [
+                    None if v is None else dictionary.setdefault(v, len(dictionary))
+                    for v in values
+                ],
+            }
+        columns[column] = values
+    return {"length": len(rows), "columns": columns}
+
+
+def export_bundle(con, brackets, prizes, path="drafty/data/bundle.json"):
+    """
+    Write the frontend data as one versioned, column oriented json bundle.
+
+    Manager, team and player names are dictionary encoded and every other
+    column is a plain array, so the file is small and compresses well with
+    gzip or brotli. The per gameweek transfers are a single `blunders` table
+    with a `gw` column, sliced by the frontend.
+    """
+    tables = dict(BUNDLE_TABLES)
+    for bracket in brackets:
+        tables[f"results_{bracket}"] = (
+            f"SELECT team_name, full_name, points FROM results_{bracket}",
+            {"team_name": "teams", "full_name": "managers"},
+        )
+
+    with Stage("export", path) as stage:
+        dictionaries = {}
+        encoded = {
+            name: encode_columns(con, query, dictionary_columns, dictionaries)
+            for name, (query, dictionary_columns) in tables.items()
+        }
+        stage.rows = sum(table["length"] for table in encoded.values())
+
+        bundle = {
+            "version": BUNDLE_VERSION,
+            "generated_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "current_gw": con.sql("SELECT MAX(gw) FROM standings_ts").fetchone()[0],
+            "config": {
+                "brackets": [
+                    {
+                        "label": f"GW {start}–{end}",
+                        "startGw": int(start),
+                        "endGw": int(end),
+                    }
+                    for start, end in brackets.values()
+                ],
+                "prizes": {str(rank): prize for rank, prize in prizes.items()},
+            },
+            "dictionaries": {
+                name: list(dictionary) for name, dictionary in dictionaries.items()
+            },
+            "tables": encoded,
+        }
+        with open(path, "w") as fp:
+            json.dump(bundle, fp, ensure_ascii=False, separators=(",", ":"))
+        stage.bytes = os.path.getsize(path)
+    logger.info(f"Exported bundle of {len(encoded)} tables to {path}")
+
+
+def publish_bundle(path, public_dir=PUBLIC_DATA_DIR):
+    """
+    Copy a bundle written by export_bundle to public_dir, where useBundle()
+    fetches it. The copy is renamed into place, so a build never sees half
+    a bundle.
+    """
+    os.makedirs(public_dir, exist_ok=True)
+    target = f"{public_dir}/bundle.json"
+    shutil.copyfile(path, f"{target}.tmp")
+    os.replace(f"{target}.tmp", target)
+    logger.info(f"Published bundle {path} to {target}")
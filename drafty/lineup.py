@@ -0,0 +1,279 @@
+import numpy as np
+import pandas as pd
+from loguru import logger
+from data_transform import create_table
+from stat_cube import StatCube
+
+SQUAD_SIZE = 15
+STARTERS = 11
+
+# Minimum number of starters per element_type (GK, DEF, MID, FWD) after autosubs
+MIN_STARTERS = np.array([0, 1, 3, 2, 1])
+
+# Legal formations as starters per element_type (GK, DEF, MID, FWD)
+FORMATIONS = [
+    (1, d, m, f)
+    for d in range(3, 6)
+    for m in range(2, 6)
+    for f in range(1, 4)
+    if d + m + f == 10
+]
+
+
+def squad_arrays(con, cube_dir: str) -> dict:
+    """
+    Picks of every (team, gameweek) as (squads, 15) arrays in position order.
+
+    The positions are the ones picked by the manager. Automatic substitutions
+    already applied by the game are undone from gw_subs: a player going off
+    takes the bench slot of the one coming on, and the starting 11 is listed
+    GK to FWD again. Squads without exactly 15 picks, e.g. a partial fetch,
+    are left out. Minutes and points are sliced from the stat cube in
+    cube_dir.
+    """
+    picks = con.sql(
+        """
+        WITH
+            swaps
+            AS
+            (
+                SELECT s.team_id, s.gw, s.element_in AS element, e.position
+                FROM main.gw_subs s
+                    JOIN main.gw_event e
+                    ON e.team_id = s.team_id
+                        AND e.gw = s.gw
+                        AND e.element = s.element_out
+                UNION ALL
+                SELECT s.team_id, s.gw, s.element_out AS element, e.position
+                FROM main.gw_subs s
+                    JOIN main.gw_event e
+                    ON e.team_id = s.team_id
+                        AND e.gw = s.gw
+                        AND e.element = s.element_in
+            )
+        SELECT
+            e.team_id,
+            e.gw,
+            e.element,
+            p.element_type::INTEGER AS element_type
+        FROM main.gw_event e
+            LEFT JOIN swaps w
+            ON e.team_id = w.team_id
+                AND e.gw = w.gw
+                AND e.element = w.element
+            JOIN main.elements p
+            ON e.element = p.id
+        QUALIFY count(*) OVER (PARTITION BY e.team_id, e.gw) = 15
+        ORDER BY
+            e.team_id,
+            e.gw,
+            coalesce(w.position, e.position) > 11,
+            -- The game lists the starting 11 by position, GK to FWD
+            CASE WHEN coalesce(w.position, e.position) <= 11 THEN p.element_type END,
+            coalesce(w.position, e.position)
+        """
+    ).fetchnumpy()
+
+    squads = len(picks["element"]) // SQUAD_SIZE
+    arrays = {
+        name: np.asarray(values).reshape(squads, SQUAD_SIZE)
+        for name, values in picks.items()
+    }
+
+    cube = StatCube.load(cube_dir)
+    rows = cube.rows(arrays["element"])
+    gws = arrays["gw"]
+    # Gameweeks without live stats yet count as not played
+    live = gws <= cube.gameweeks
+    cols = np.where(live, gws - 1, 0)
+    for name, stat in [("minutes", "minutes"), ("points", "total_points")]:
+        values = cube.stat(stat)[rows, cols].astype(int)
+        arrays[name] = np.where(live, values, 0)
+
+    arrays["team_id"] = arrays["team_id"][:, 0]
+    arrays["gw"] = arrays["gw"][:, 0]
+    return arrays
+
+
+def autosubs(element_type: np.ndarray, minutes: np.ndarray) -> np.ndarray:
+    """
+    Apply FPL automatic substitutions to every squad at once.
+
+    Starters are considered in position order. A starter who did not play is
+    replaced by the first bench player, in bench order, who played, has not
+    come on already and keeps a valid formation: a goalkeeper only for a
+    goalkeeper, and at least 3 defenders, 2 midfielders and 1 forward. The
+    loops run over the 11 starting and 4 bench slots, each step vectorised
+    over all squads.
+
+    Args:
+        element_type (np.ndarray): (squads, 15) element types, 1 = GK.
+        minutes (np.ndarray): (squads, 15) minutes played.
+
+    Returns:
+        np.ndarray: (squads, 15) index of the bench slot replacing each
+            starter, or -1 where the starter stays on.
+    """
+    squads = np.arange(len(element_type))
+    played = minutes > 0
+    on_pitch = np.zeros(element_type.shape, dtype=bool)
+    on_pitch[:, :STARTERS] = True
+    formation = np.zeros((len(element_type), len(MIN_STARTERS)), dtype=int)
+    for slot in range(STARTERS):
+        formation[squads, element_type[:, slot]] += 1
+
+    replaced_by = np.full(element_type.shape, -1)
+    for slot in range(STARTERS):
+        type_out = element_type[:, slot]
+        needs_sub = ~played[:, slot]
+        # Dropping the starter must not break the formation unless the sub
+        # plays the same position
+        can_drop = formation[squads, type_out] > MIN_STARTERS[type_out]
+        for bench in range(STARTERS, SQUAD_SIZE):
+            type_in = element_type[:, bench]
+            sub = (
+                needs_sub
+                & played[:, bench]
+                & ~on_pitch[:, bench]
+                & ((type_in == 1) == (type_out == 1))
+                & (can_drop | (type_in == type_out))
+            )
+            on_pitch[sub, slot] = False
+            on_pitch[sub, bench] = True
+            formation[sub, type_out[sub]] -= 1
+            formation[sub, type_in[sub]] += 1
+            replaced_by[sub, slot] = bench
+            needs_sub &= ~sub
+
+    return replaced_by
+
+
+def calc_autosubs(con, cube_dir):
+    """
+    Simulate the automatic substitutions of every team and gameweek.
+
+    Creates autosubs, one row per substitution, and lineup_points, the
+    points per (team_id, gw) of the picked 11 (xi_points), gained by
+    substitutes coming on (autosub_gain), scored in total (points) and left
+    on the bench after the substitutions (bench_points).
+
+    For a finished gameweek the points match team_history. In a gameweek still
+    in progress, players yet to play count as not playing, so its substitutions
+    are provisional.
+    """
+    squads = squad_arrays(con, cube_dir)
+    replaced_by = autosubs(squads["element_type"], squads["minutes"])
+    points = squads["points"]
+
+    rows, slots = np.nonzero(replaced_by[:, :STARTERS] >= 0)
+    benches = replaced_by[rows, slots]
+    subs = pd.DataFrame(
+        {
+            "team_id": squads["team_id"][rows],
+            "gw": squads["gw"][rows],
+            "element_out": squads["element"][rows, slots],
+            "element_in": squads["element"][rows, benches],
+            "position_out": slots + 1,
+            "position_in": benches + 1,
+            "points_in": points[rows, benches],
+        }
+    )
+
+    came_on = np.zeros(points.shape, dtype=bool)
+    came_on[rows, benches] = True
+    went_off = replaced_by >= 0
+    xi_points = points[:, :STARTERS].sum(axis=1)
+    gain = (np.where(came_on, points, 0) - np.where(went_off, points, 0)).sum(axis=1)
+    lineup = pd.DataFrame(
+        {
+            "team_id": squads["team_id"],
+            "gw": squads["gw"],
+            "xi_points": xi_points,
+            "autosub_gain": gain,
+            "points": xi_points + gain,
+            "bench_points": np.where(came_on, 0, points)[:, STARTERS:].sum(axis=1),
+        }
+    )
+
+    con.register("autosubs_df", subs)
+    con.register("lineup_points_df", lineup)
+    create_table(con, "autosubs", "SELECT * FROM autosubs_df ORDER BY gw, team_id")
+    create_table(
+        con, "lineup_points", "SELECT * FROM lineup_points_df ORDER BY gw, team_id"
+    )
+    con.unregister("autosubs_df")
+    con.unregister("lineup_points_df")
+    logger.info(f"Simulated {len(subs)} autosubs over {len(lineup)} lineups")
+
+
+def optimal_points(element_type: np.ndarray, points: np.ndarray) -> tuple:
+    """
+    Best points of every squad over all legal formations, in hindsight.
+
+    The points of each element_type are sorted in descending order and
+    summed cumulatively, so the best k players of a type are one lookup.
+    The score of a formation is then four lookups, for all squads and all 8
+    formations at once.
+
+    Args:
+        element_type (np.ndarray): (squads, 15) element types, 1 = GK.
+        points (np.ndarray): (squads, 15) points scored.
+
+    Returns:
+        tuple: (squads,) best points and (squads,) index into FORMATIONS.
+    """
+    squads = len(points)
+    # prefix[t][:, k] is the sum of the best k players of type t, -inf if the
+    # squad has fewer than k of them
+    prefix = {}
+    for t in range(1, len(MIN_STARTERS)):
+        best = -np.sort(-np.where(element_type == t, points, -np.inf), axis=1)
+        prefix[t] = np.concatenate([np.zeros((squads, 1)), best.cumsum(axis=1)], axis=1)
+
+    scores = np.stack(
+        [
+            sum(prefix[t][:, count] for t, count in enumerate(formation, start=1))
+            for formation in FORMATIONS
+        ],
+        axis=1,
+    )
+    return scores.max(axis=1), scores.argmax(axis=1)
+
+
+def calc_optimal_lineups(con, cube_dir):
+    """
+    Hindsight optimal lineup of every team and gameweek.
+
+    Creates optimal_lineups with the best points (optimal_points) and
+    formation any legal 11 from the squad would have scored, the points
+    scored after autosubs from lineup_points (points) and the gap between
+    the two.
+    """
+    squads = squad_arrays(con, cube_dir)
+    best, formation = optimal_points(squads["element_type"], squads["points"])
+    optimal = pd.DataFrame(
+        {
+            "team_id": squads["team_id"],
+            "gw": squads["gw"],
+            "optimal_points": best.astype(int),
+            "formation": ["-".join(map(str, FORMATIONS[i][1:])) for i in formation],
+        }
+    )
+
+    con.register("optimal_lineups_df", optimal)
+    create_table(
+        con,
+        "optimal_lineups",
+        """
+        SELECT
+            o.*,
+            l.points,
+            o.optimal_points - l.points AS gap
+        FROM optimal_lineups_df o
+            JOIN main.lineup_points l
+            ON o.team_id = l.team_id
+                AND o.gw = l.gw
+        ORDER BY o.gw, o.team_id
+        """,
+    )
+    con.unregister("optimal_lineups_df")
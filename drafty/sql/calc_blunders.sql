@@ -6,7 +6,9 @@ WITH
         SELECT *
         FROM main.transactions tr
         WHERE result = 'a'
-            AND event = {{ gw }}
+        {%- if from_gw %}
+            AND event >= {{ from_gw }}
+        {%- endif %}
     ),
     gwl
     as
@@ -56,6 +58,7 @@ WITH
             ON m.entry = b.entry_id
     )
 SELECT
+    event as gw,
     team_name as team,
     kind as waiver_or_free,
     event as waiver_gw,
@@ -64,6 +67,7 @@ SELECT
     in_pts as player_in_pts,
     element_out_name as player_out,
     out_pts as player_out_pts,
-    diff as net_pts, 
+    diff as net_pts,
+    id as transaction_id,
 FROM details
-ORDER BY diff asc
\ No newline at end of file
+ORDER BY event, diff asc, id
\ No newline at end of file
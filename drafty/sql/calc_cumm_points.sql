@@ -4,6 +4,9 @@ WITH
     (
         SELECT team_id, gw, points, total_points
         FROM main.total_points
+        {%- if from_gw %}
+        WHERE gw >= {{ from_gw }}
+        {%- endif %}
     )
 SELECT
     b.player_first_name AS name,
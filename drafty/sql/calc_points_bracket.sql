@@ -12,7 +12,7 @@ WITH
     (
         SELECT
             team_id,
-            SUM(points) as points
+            SUM(points)::BIGINT as points
         FROM gw
         GROUP BY 1
     )
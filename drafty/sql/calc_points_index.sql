@@ -0,0 +1,40 @@
+
+WITH
+    gameweeks
+    AS
+    (
+        SELECT
+            unnest(range(1, MAX(gw) + 1)) AS gw
+        FROM main.gw_live
+    ),
+    points
+    AS
+    (
+        SELECT
+            p.id,
+            g.gw,
+            coalesce(l.total_points, 0) AS total_points
+        FROM main.elements p
+            CROSS JOIN gameweeks g
+            LEFT JOIN main.gw_live l
+            ON l.id = p.id
+                AND l.gw = g.gw
+    ),
+    cumulative
+    AS
+    (
+        SELECT
+            id,
+            gw,
+            SUM(total_points) OVER (
+                PARTITION BY id ORDER BY gw
+            )::INTEGER AS cum_points
+        FROM points
+    )
+-- cum_points[gw + 1] is the total up to and including gw, cum_points[1] = 0
+SELECT
+    id,
+    [0] || list(cum_points ORDER BY gw) AS cum_points
+FROM cumulative
+GROUP BY id
+ORDER BY id
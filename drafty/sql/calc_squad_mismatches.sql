@@ -0,0 +1,44 @@
+
+WITH
+    picked
+    AS
+    (
+        SELECT
+            team_id,
+            element,
+            gw
+        FROM main.gw_event
+    ),
+    replayed
+    AS
+    (
+        SELECT
+            s.team_id,
+            s.element,
+            s.gw
+        FROM main.squads s
+            SEMI JOIN picked p
+            ON s.team_id = p.team_id
+                AND s.gw = p.gw
+    )
+SELECT
+    *,
+    'log' AS only_in
+FROM (
+    SELECT * FROM replayed
+    EXCEPT
+    SELECT * FROM picked
+)
+UNION ALL
+SELECT
+    *,
+    'picks' AS only_in
+FROM (
+    SELECT * FROM picked
+    EXCEPT
+    SELECT * FROM replayed
+)
+ORDER BY
+    gw,
+    team_id,
+    only_in
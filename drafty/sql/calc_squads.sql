@@ -0,0 +1,74 @@
+
+WITH
+    picks
+    AS
+    (
+        SELECT
+            entry,
+            element,
+            1 AS gw,
+            1 AS delta
+        FROM main.choices
+    ),
+    moves
+    AS
+    (
+        SELECT
+            entry,
+            element_in AS element,
+            event AS gw,
+            1 AS delta
+        FROM main.transactions
+        WHERE result = 'a'
+        UNION ALL
+        SELECT
+            entry,
+            element_out AS element,
+            event AS gw,
+            -1 AS delta
+        FROM main.transactions
+        WHERE result = 'a'
+    ),
+    changes
+    AS
+    (
+        SELECT
+            entry,
+            element,
+            gw,
+            SUM(SUM(delta)) OVER (
+                PARTITION BY entry, element ORDER BY gw
+            ) AS held,
+            LEAD(gw) OVER (
+                PARTITION BY entry, element ORDER BY gw
+            ) AS next_gw
+        FROM (
+            SELECT * FROM picks
+            UNION ALL
+            SELECT * FROM moves
+        )
+        GROUP BY
+        entry,
+        element,
+        gw
+    ),
+    gameweeks
+    AS
+    (
+        SELECT
+            unnest(range(1, MAX(event) + 1)) AS gw
+        FROM main.status
+    )
+SELECT
+    c.entry AS team_id,
+    c.element,
+    g.gw
+FROM changes c
+    JOIN gameweeks g
+    ON g.gw >= c.gw
+        AND (c.next_gw IS NULL OR g.gw < c.next_gw)
+WHERE c.held > 0
+ORDER BY
+    g.gw,
+    c.entry,
+    c.element
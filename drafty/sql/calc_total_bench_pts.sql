@@ -1,4 +1,4 @@
-SELECT name, SUM(pts_lost) as bench_pts
+SELECT name, SUM(pts_lost)::BIGINT as bench_pts
 FROM bench_pts
 GROUP BY name
 ORDER BY bench_pts
\ No newline at end of file
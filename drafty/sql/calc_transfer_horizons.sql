@@ -0,0 +1,89 @@
+
+WITH
+    transactions_c
+    AS
+    (
+        SELECT *
+        FROM main.transactions
+        WHERE result = 'a'
+    ),
+    dropped
+    AS
+    (
+        -- The first later transaction of the same team releasing player_in
+        SELECT
+            tr.id,
+            MIN(later.event) AS dropped_gw
+        FROM transactions_c tr
+            JOIN transactions_c later
+            ON later.entry = tr.entry
+                AND later.element_out = tr.element_in
+                AND (later.event > tr.event
+                    OR (later.event = tr.event AND later.id > tr.id))
+        GROUP BY tr.id
+    ),
+    horizons
+    AS
+    (
+        SELECT
+            unnest([{% for h in horizons %}'{{ h }}', {% endfor %}'held']) AS horizon,
+            unnest([{% for h in horizons %}{{ h }}, {% endfor %}NULL]) AS gws
+    ),
+    windows
+    AS
+    (
+        SELECT
+            tr.*,
+            h.horizon,
+            -- Every horizon counts from the transfer gameweek, the first one
+            -- player_in is in the squad as in squads, and ends with the one
+            -- before the player was dropped. held has no other limit
+            tr.event AS first_gw,
+            LEAST(tr.event + h.gws - 1, d.dropped_gw - 1, m.max_gw) AS last_gw
+        FROM transactions_c tr
+            CROSS JOIN horizons h
+            CROSS JOIN (SELECT MAX(gw) AS max_gw FROM main.gw_live) m
+            LEFT JOIN dropped d
+            ON d.id = tr.id
+    ),
+    valued
+    AS
+    (
+        SELECT
+            w.*,
+            CASE WHEN w.last_gw >= w.first_gw THEN
+                pi.cum_points[w.last_gw + 1] - pi.cum_points[w.first_gw]
+            END AS in_pts,
+            CASE WHEN w.last_gw >= w.first_gw THEN
+                po.cum_points[w.last_gw + 1] - po.cum_points[w.first_gw]
+            END AS out_pts
+        FROM windows w
+            LEFT JOIN main.player_points_index pi
+            ON w.element_in = pi.id
+            LEFT JOIN main.player_points_index po
+            ON w.element_out = po.id
+    )
+SELECT
+    v.event AS gw,
+    v.horizon,
+    b.entry_name AS team,
+    v.kind AS waiver_or_free,
+    v.event AS waiver_gw,
+    v.first_gw AS next_gw,
+    v.last_gw,
+    pi.web_name AS player_in,
+    v.in_pts AS player_in_pts,
+    po.web_name AS player_out,
+    v.out_pts AS player_out_pts,
+    v.in_pts - v.out_pts AS net_pts,
+    v.element_in,
+    v.element_out,
+    v.id AS transaction_id
+FROM valued v
+    LEFT JOIN main.elements pi
+    ON v.element_in = pi.id
+    LEFT JOIN main.elements po
+    ON v.element_out = po.id
+    LEFT JOIN main.league_entries b
+    ON v.entry = b.entry_id
+ORDER BY v.horizon, v.event, net_pts, v.id
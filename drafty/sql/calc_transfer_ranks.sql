@@ -0,0 +1,26 @@
+WITH
+    ranked
+    AS
+    (
+        SELECT
+            *,
+            -- transaction_id breaks ties, so ranks are stable between runs
+            ROW_NUMBER() OVER (ORDER BY net_pts DESC, waiver_gw, transaction_id) AS best_rank,
+            ROW_NUMBER() OVER (ORDER BY net_pts ASC, waiver_gw, transaction_id) AS worst_rank,
+            ROW_NUMBER() OVER (PARTITION BY team ORDER BY net_pts DESC, waiver_gw, transaction_id) AS team_best_rank,
+            ROW_NUMBER() OVER (PARTITION BY team ORDER BY net_pts ASC, waiver_gw, transaction_id) AS team_worst_rank,
+            ROW_NUMBER() OVER (PARTITION BY waiver_or_free ORDER BY net_pts DESC, waiver_gw, transaction_id) AS kind_best_rank,
+            ROW_NUMBER() OVER (PARTITION BY waiver_or_free ORDER BY net_pts ASC, waiver_gw, transaction_id) AS kind_worst_rank
+        FROM main.blunders
+        WHERE net_pts IS NOT NULL
+    )
+SELECT *
+FROM ranked
+WHERE LEAST(
+    best_rank,
+    worst_rank,
+    team_best_rank,
+    team_worst_rank,
+    kind_best_rank,
+    kind_worst_rank
+) <= {{ k }}
@@ -1,14 +1,10 @@
-
-{% for team_id in team_ids %}
 SELECT
-    entry AS team_id,
-    event AS gw,
-    points AS points,
-    total_points AS total_points
-FROM {%-
-if true %} team_{{ team_id }} {%- endif %}
-{%
-if not loop.last %}
-UNION ALL
-{% endif %}
-{% endfor %}
\ No newline at end of file
+    entry_id AS team_id,
+    gw,
+    points,
+    total_points
+FROM main.team_history
+{%- if from_gw %}
+WHERE gw >= {{ from_gw }}
+{%- endif %}
+ORDER BY team_id, gw
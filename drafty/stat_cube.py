@@ -0,0 +1,158 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+from loguru import logger
+from data_transform import create_table
+
+# Numeric gw_live columns that become stats of the cube
+NUMERIC_TYPES = {"BIGINT", "INTEGER", "DOUBLE", "FLOAT", "SMALLINT", "TINYINT"}
+
+# File in the cube directory naming the version directory of the current cube
+CURRENT_FILE = "current"
+
+
+class StatCube:
+    """
+    Dense players x gameweeks x stats float32 array of the live stats.
+
+    Every build is written to its own version directory in the cube directory,
+    an .npy file opened memory mapped next to index.json with the sorted
+    element ids of its rows and the names of its stats. The `current` file
+    names the version to read. Gameweek gw is column gw - 1, and players
+    without live stats in a gameweek are 0, so lookups are array slices rather
+    than joins on (id, gw).
+
+    Example:
+        cube = StatCube.load("drafty/data/league_33786/stat_cube")
+        points = cube.stat("total_points")[cube.rows([1, 2])]  # (2, gameweeks)
+    """
+
+    def __init__(self, data: np.ndarray, ids: np.ndarray, stats: list):
+        self.data = data
+        self.ids = ids
+        self.stats = stats
+
+    @staticmethod
+    def version(cube_dir: str) -> str:
+        """The version directory of the current cube in cube_dir."""
+        with open(f"{cube_dir}/{CURRENT_FILE}") as fp:
+            return fp.read().strip()
+
+    @classmethod
+    def load(cls, cube_dir: str) -> "StatCube":
+        # A version directory is never changed once written, so its index
+        # and array always match, even while a new cube is being built
+        version_dir = f"{cube_dir}/{cls.version(cube_dir)}"
+        with open(f"{version_dir}/index.json") as fp:
+            index = json.load(fp)
+        data = np.load(f"{version_dir}/stats.npy", mmap_mode="r")
+        return cls(data, np.asarray(index["ids"]), index["stats"])
+
+    @property
+    def gameweeks(self) -> int:
+        return self.data.shape[1]
+
+    def rows(self, ids) -> np.ndarray:
+        """Row of every element id, raising KeyError for unknown ids."""
+        ids = np.asarray(ids)
+        rows = np.searchsorted(self.ids, ids)
+        rows = np.minimum(rows, len(self.ids) - 1)
+        if not np.array_equal(self.ids[rows], ids):
+            raise KeyError(
+                f"Unknown element ids {sorted(set(ids[self.ids[rows] != ids]))}"
+            )
+        return rows
+
+    def stat(self, name: str) -> np.ndarray:
+        """(players, gameweeks) view of one stat."""
+        return self.data[:, :, self.stats.index(name)]
+
+
+def build_stat_cube(con, cube_dir: str) -> None:
+    """
+    Build the stat cube of gw_live for every element and write it to cube_dir.
+
+    The array and index are written to a new directory, named after the
+    digest of their contents, which then becomes current with a single
+    rename of the `current` file. A reader sees either the old or the new
+    cube in full, and one holding the old cube memory mapped keeps reading
+    it. The previous version is kept for readers that have just looked it
+    up, older ones are removed. The row of every element id is also kept in
+    the stat_cube_index table.
+    """
+    columns = con.sql("DESCRIBE main.gw_live").fetchall()
+    stats = [
+        name
+        for name, column_type, *_ in columns
+        if column_type in NUMERIC_TYPES and name not in ("id", "gw")
+    ]
+    ids = con.sql(
+        """
+        SELECT id FROM main.elements
+        UNION
+        SELECT id FROM main.gw_live
+        ORDER BY id
+        """
+    ).fetchnumpy()["id"]
+    gameweeks = con.sql("SELECT MAX(gw) FROM main.gw_live").fetchone()[0]
+
+    live = con.sql(f"SELECT id, gw, {', '.join(stats)} FROM main.gw_live").fetchnumpy()
+    rows = np.searchsorted(ids, live["id"])
+    cols = np.asarray(live["gw"]) - 1
+
+    os.makedirs(cube_dir, exist_ok=True)
+    build_dir = tempfile.mkdtemp(prefix=".build-", dir=cube_dir)
+    data = np.lib.format.open_memmap(
+        f"{build_dir}/stats.npy",
+        mode="w+",
+        dtype=np.float32,
+        shape=(len(ids), gameweeks, len(stats)),
+    )
+    data[:] = 0
+    for k, name in enumerate(stats):
+        data[rows, cols, k] = np.ma.filled(live[name], 0)
+    data.flush()
+    del data
+    with open(f"{build_dir}/index.json", "w") as fp:
+        json.dump({"ids": ids.tolist(), "stats": stats}, fp)
+
+    sha = hashlib.sha256()
+    for name in ["index.json", "stats.npy"]:
+        with open(f"{build_dir}/{name}", "rb") as fp:
+            for chunk in iter(lambda: fp.read(1024**2), b""):
+                sha.update(chunk)
+    version = sha.hexdigest()[:16]
+    if os.path.exists(f"{cube_dir}/{version}"):
+        shutil.rmtree(build_dir)
+    else:
+        os.rename(build_dir, f"{cube_dir}/{version}")
+
+    previous = None
+    if os.path.exists(f"{cube_dir}/{CURRENT_FILE}"):
+        previous = StatCube.version(cube_dir)
+    if version != previous:
+        with open(f"{cube_dir}/{CURRENT_FILE}.tmp", "w") as fp:
+            fp.write(version)
+        os.replace(f"{cube_dir}/{CURRENT_FILE}.tmp", f"{cube_dir}/{CURRENT_FILE}")
+
+        for name in os.listdir(cube_dir):
+            path = f"{cube_dir}/{name}"
+            if name in (CURRENT_FILE, version, previous):
+                continue
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+
+    create_table(
+        con,
+        "stat_cube_index",
+        f"SELECT unnest({ids.tolist()}) AS id, unnest(range({len(ids)})) AS row",
+    )
+    logger.info(
+        f"Built stat cube of {len(ids)} players x {gameweeks} gameweeks x "
+        f"{len(stats)} stats in {cube_dir}"
+    )
@@ -1,8 +1,7 @@
 echo "Refreshing the Data"
 
-rm -r drafty/data/
-rm drafty.db
+# drafty/data/ keeps the raw store, manifests and league databases the
+# incremental refresh builds on, so it is not deleted
+poetry run python drafty/data_pipeline.py --refresh True --incremental True
 
-poetry run python drafty/data_pipeline.py --refresh True
-
-poetry run streamlit run drafty/app_main.py
\ No newline at end of file
+poetry run streamlit run drafty/app_main.py
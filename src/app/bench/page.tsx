@@ -2,22 +2,23 @@
 
 import { useState, useMemo } from "react";
 import Link from "next/link";
-import { useCsvData } from "@/hooks/useData";
+import { useBundle, decodeTable } from "@/hooks/useData";
+import type { BundleRow } from "@/hooks/useData";
 import type { BenchEntry, BenchDetail } from "@/lib/types";
 import BenchEfficiency from "@/components/BenchEfficiency";
 
-function mapBenchRow(row: Record<string, string>): BenchEntry {
+function mapBenchRow(row: BundleRow): BenchEntry {
   return {
-    name: row["name"] ?? "",
-    benchPts: parseFloat(row["bench_pts"] ?? "0"),
+    name: String(row["name"] ?? ""),
+    benchPts: Number(row["bench_pts"] ?? 0),
   };
 }
 
-function mapBenchDetailRow(row: Record<string, string>): BenchDetail {
+function mapBenchDetailRow(row: BundleRow): BenchDetail {
   return {
-    name: row["name"] ?? "",
-    playerType: row["player_type"] ?? "",
-    ptsLost: parseFloat(row["pts_lost"] ?? "0"),
+    name: String(row["name"] ?? ""),
+    playerType: String(row["player_type"] ?? ""),
+    ptsLost: Number(row["pts_lost"] ?? 0),
   };
 }
 
@@ -34,14 +35,9 @@ const POSITION_BADGE: Record<string, { color: string; bg: string }> = {
 export default function BenchPage() {
   const [activeFilter, setActiveFilter] = useState<PositionFilter>("All");
 
-  const { data: benchData, loading: loadingBench } = useCsvData(
-    "/data/total_bench_pts.csv",
-    mapBenchRow
-  );
-  const { data: detailData, loading: loadingDetail } = useCsvData(
-    "/data/bench_pts.csv",
-    mapBenchDetailRow
-  );
+  const { bundle, loading: loadingBundle } = useBundle();
+  const benchData = useMemo(() => (bundle ? decodeTable(bundle, "total_bench_pts", mapBenchRow) : null), [bundle]);
+  const detailData = useMemo(() => (bundle ? decodeTable(bundle, "bench_pts", mapBenchDetailRow) : null), [bundle]);
 
   const filtered = useMemo(() => {
     if (!detailData) return [];
@@ -52,7 +48,7 @@ export default function BenchPage() {
     return [...rows].sort((a, b) => a.ptsLost - b.ptsLost);
   }, [detailData, activeFilter]);
 
-  const loading = loadingBench || loadingDetail;
+  const loading = loadingBundle;
 
   return (
     <div className="min-h-screen px-4 py-8">
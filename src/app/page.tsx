@@ -1,48 +1,49 @@
 "use client";
 
 import { useMemo } from "react";
-import { useCsvData, useJsonData } from "@/hooks/useData";
-import type { AppConfig, BracketTeam, StandingsEntry, Transfer, BenchEntry } from "@/lib/types";
+import { useBundle, decodeTable } from "@/hooks/useData";
+import type { BundleRow } from "@/hooks/useData";
+import type { BracketTeam, StandingsEntry, Transfer, BenchEntry } from "@/lib/types";
 import Header from "@/components/Header";
 import BracketCard from "@/components/BracketCard";
 import StandingsTimeline from "@/components/StandingsTimeline";
 import TransferHighlights from "@/components/TransferHighlights";
 import BenchEfficiency from "@/components/BenchEfficiency";
 
-function mapBracketRow(row: Record<string, string>): { teamName: string; fullName: string; points: number } {
+function mapBracketRow(row: BundleRow): { teamName: string; fullName: string; points: number } {
   return {
-    teamName: row["team_name"] ?? "",
-    fullName: row["full_name"] ?? "",
-    points: parseFloat(row["points"] ?? "0"),
+    teamName: String(row["team_name"] ?? ""),
+    fullName: String(row["full_name"] ?? ""),
+    points: Number(row["points"] ?? 0),
   };
 }
 
-function mapStandingsRow(row: Record<string, string>): StandingsEntry {
+function mapStandingsRow(row: BundleRow): StandingsEntry {
   return {
-    name: row["name"] ?? "",
-    gw: parseInt(row["gw"] ?? "0"),
-    position: parseInt(row["pos"] ?? "0"),
+    name: String(row["name"] ?? ""),
+    gw: Number(row["gw"] ?? 0),
+    position: Number(row["pos"] ?? 0),
   };
 }
 
-function mapTransferRow(row: Record<string, string>): Transfer {
+function mapTransferRow(row: BundleRow): Transfer {
   return {
-    team: row["team"] ?? "",
-    waiverOrFree: row["waiver_or_free"] ?? "",
-    waiverGw: parseInt(row["waiver_gw"] ?? "0"),
-    nextGw: parseFloat(row["next_gw"] ?? "0"),
-    playerIn: row["player_in"] ?? "",
-    playerInPts: parseFloat(row["player_in_pts"] ?? "0"),
-    playerOut: row["player_out"] ?? "",
-    playerOutPts: parseFloat(row["player_out_pts"] ?? "0"),
-    netPts: parseFloat(row["net_pts"] ?? "0"),
+    team: String(row["team"] ?? ""),
+    waiverOrFree: String(row["waiver_or_free"] ?? ""),
+    waiverGw: Number(row["waiver_gw"] ?? 0),
+    nextGw: Number(row["next_gw"] ?? 0),
+    playerIn: String(row["player_in"] ?? ""),
+    playerInPts: Number(row["player_in_pts"] ?? 0),
+    playerOut: String(row["player_out"] ?? ""),
+    playerOutPts: Number(row["player_out_pts"] ?? 0),
+    netPts: Number(row["net_pts"] ?? 0),
   };
 }
 
-function mapBenchRow(row: Record<string, string>): BenchEntry {
+function mapBenchRow(row: BundleRow): BenchEntry {
   return {
-    name: row["name"] ?? "",
-    benchPts: parseFloat(row["bench_pts"] ?? "0"),
+    name: String(row["name"] ?? ""),
+    benchPts: Number(row["bench_pts"] ?? 0),
   };
 }
 
@@ -55,19 +56,21 @@ function DataUnavailable({ label }: { label: string }) {
 }
 
 export default function Dashboard() {
-  const { data: config } = useJsonData<AppConfig>("/data/config.json");
-  const { data: bracket1 } = useCsvData("/data/results_1.csv", mapBracketRow);
-  const { data: bracket2 } = useCsvData("/data/results_2.csv", mapBracketRow);
-  const { data: bracket3 } = useCsvData("/data/results_3.csv", mapBracketRow);
-  const { data: standings } = useCsvData("/data/standings_ts.csv", mapStandingsRow);
-  const { data: bestTransfers } = useCsvData("/data/top_df.csv", mapTransferRow);
-  const { data: worstTransfers } = useCsvData("/data/bottom_df.csv", mapTransferRow);
-  const { data: benchData } = useCsvData("/data/total_bench_pts.csv", mapBenchRow);
-
-  const currentGw = useMemo(() => {
-    if (!standings) return 0;
-    return Math.max(...standings.map((s) => s.gw));
-  }, [standings]);
+  const { bundle } = useBundle();
+  const config = bundle?.config ?? null;
+  const currentGw = bundle?.current_gw ?? 0;
+
+  const [bracket1, bracket2, bracket3] = useMemo(
+    () => [1, 2, 3].map((b) => (bundle ? decodeTable(bundle, `results_${b}`, mapBracketRow) : null)),
+    [bundle]
+  );
+  const standings = useMemo(() => (bundle ? decodeTable(bundle, "standings_ts", mapStandingsRow) : null), [bundle]);
+  const bestTransfers = useMemo(() => (bundle ? decodeTable(bundle, "top_n_transfers", mapTransferRow) : null), [bundle]);
+  const worstTransfers = useMemo(
+    () => (bundle ? decodeTable(bundle, "bottom_n_transfers", mapTransferRow) : null),
+    [bundle]
+  );
+  const benchData = useMemo(() => (bundle ? decodeTable(bundle, "total_bench_pts", mapBenchRow) : null), [bundle]);
 
   const bracketResults = useMemo(() => {
     if (!config) return [];
@@ -2,20 +2,21 @@
 
 import { useState, useMemo } from "react";
 import Link from "next/link";
-import { useCsvData } from "@/hooks/useData";
-import type { Transfer, StandingsEntry } from "@/lib/types";
+import { useBundle, decodeTable } from "@/hooks/useData";
+import type { BundleRow } from "@/hooks/useData";
+import type { Transfer } from "@/lib/types";
 
-function mapTransferRow(row: Record<string, string>): Transfer {
+function mapTransferRow(row: BundleRow): Transfer {
   return {
-    team: row["team"] ?? "",
-    waiverOrFree: row["waiver_or_free"] ?? "",
-    waiverGw: parseInt(row["waiver_gw"] ?? "0"),
-    nextGw: parseFloat(row["next_gw"] ?? "0"),
-    playerIn: row["player_in"] ?? "",
-    playerInPts: parseFloat(row["player_in_pts"] ?? "0"),
-    playerOut: row["player_out"] ?? "",
-    playerOutPts: parseFloat(row["player_out_pts"] ?? "0"),
-    netPts: parseFloat(row["net_pts"] ?? "0"),
+    team: String(row["team"] ?? ""),
+    waiverOrFree: String(row["waiver_or_free"] ?? ""),
+    waiverGw: Number(row["waiver_gw"] ?? 0),
+    nextGw: Number(row["next_gw"] ?? 0),
+    playerIn: String(row["player_in"] ?? ""),
+    playerInPts: Number(row["player_in_pts"] ?? 0),
+    playerOut: String(row["player_out"] ?? ""),
+    playerOutPts: Number(row["player_out_pts"] ?? 0),
+    netPts: Number(row["net_pts"] ?? 0),
   };
 }
 
@@ -86,8 +87,8 @@ function SummaryCard({
   );
 }
 
-function mapStandingsRow(row: Record<string, string>): StandingsEntry {
-  return { name: row["name"] ?? "", gw: parseInt(row["gw"] ?? "0"), position: parseInt(row["pos"] ?? "0") };
+function mapBlunderRow(row: BundleRow): Transfer & { gw: number } {
+  return { ...mapTransferRow(row), gw: Number(row["gw"] ?? 0) };
 }
 
 function GwTable({ transfers, loading, error }: { transfers: Transfer[] | null; loading: boolean; error: string | null }) {
@@ -157,22 +158,20 @@ function GwTable({ transfers, loading, error }: { transfers: Transfer[] | null;
 export default function TransfersPage() {
   const [selectedGw, setSelectedGw] = useState(1);
 
-  const { data: standings } = useCsvData("/data/standings_ts.csv", mapStandingsRow);
-  const currentGw = useMemo(() => {
-    if (!standings) return 0;
-    return Math.max(...standings.map((s) => s.gw));
-  }, [standings]);
+  const { bundle, loading, error } = useBundle();
+  const currentGw = bundle?.current_gw ?? 0;
   const gwOptions = useMemo(() => Array.from({ length: currentGw }, (_, i) => i + 1), [currentGw]);
 
-  const { data: bestTransfers, loading: bestLoading } = useCsvData("/data/top_df.csv", mapTransferRow);
-  const { data: worstTransfers, loading: worstLoading } = useCsvData("/data/bottom_df.csv", mapTransferRow);
-  const {
-    data: gwTransfers,
-    loading: gwLoading,
-    error: gwError,
-  } = useCsvData(`/data/blunders_${selectedGw}.csv`, mapTransferRow);
-
-  const summaryLoading = bestLoading || worstLoading;
+  const bestTransfers = useMemo(() => (bundle ? decodeTable(bundle, "top_n_transfers", mapTransferRow) : null), [bundle]);
+  const worstTransfers = useMemo(
+    () => (bundle ? decodeTable(bundle, "bottom_n_transfers", mapTransferRow) : null),
+    [bundle]
+  );
+  const blunders = useMemo(() => (bundle ? decodeTable(bundle, "blunders", mapBlunderRow) : null), [bundle]);
+  const gwTransfers = useMemo(
+    () => (blunders ? blunders.filter((t) => t.gw === selectedGw) : null),
+    [blunders, selectedGw]
+  );
 
   return (
     <div className="min-h-screen px-4 py-8">
@@ -196,7 +195,7 @@ export default function TransfersPage() {
           <h2 className="text-mint text-[10px] font-semibold uppercase tracking-[2px] mb-2.5">
             All-Time Best &amp; Worst
           </h2>
-          {summaryLoading ? (
+          {loading ? (
             <div className="text-mint text-sm animate-pulse text-center py-6">Loading...</div>
           ) : (
             <div className="flex flex-col md:flex-row gap-2.5">
@@ -230,7 +229,7 @@ export default function TransfersPage() {
           </div>
 
           <div className="bg-ocean-surface rounded-lg p-4 border border-mint/10">
-            <GwTable transfers={gwTransfers} loading={gwLoading} error={gwError} />
+            <GwTable transfers={gwTransfers} loading={loading} error={error} />
           </div>
         </section>
 
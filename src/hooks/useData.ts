@@ -1,58 +1,7 @@
 "use client";
 
 import { useState, useEffect } from "react";
-
-function parseCsvLine(line: string): string[] {
-  const result: string[] = [];
-  let current = "";
-  let inQuotes = false;
-  for (let i = 0; i < line.length; i++) {
-    const ch = line[i];
-    if (ch === '"') {
-      inQuotes = !inQuotes;
-    } else if (ch === "," && !inQuotes) {
-      result.push(current.trim());
-      current = "";
-    } else {
-      current += ch;
-    }
-  }
-  result.push(current.trim());
-  return result;
-}
-
-function parseCsv<T>(text: string, mapRow: (row: Record<string, string>) => T): T[] {
-  const lines = text.trim().split("\n");
-  if (lines.length < 2) return [];
-  const headers = parseCsvLine(lines[0]);
-  return lines.slice(1).map((line) => {
-    const values = parseCsvLine(line);
-    const row: Record<string, string> = {};
-    headers.forEach((h, i) => {
-      row[h] = values[i] ?? "";
-    });
-    return mapRow(row);
-  });
-}
-
-export function useCsvData<T>(path: string, mapRow: (row: Record<string, string>) => T) {
-  const [data, setData] = useState<T[] | null>(null);
-  const [loading, setLoading] = useState(true);
-  const [error, setError] = useState<string | null>(null);
-
-  useEffect(() => {
-    fetch(path)
-      .then((res) => {
-        if (!res.ok) throw new Error(`Failed to fetch ${path}`);
-        return res.text();
-      })
-      .then((text) => setData(parseCsv(text, mapRow)))
-      .catch((err) => setError(err.message))
-      .finally(() => setLoading(false));
-  }, [path]); // eslint-disable-line react-hooks/exhaustive-deps
-
-  return { data, loading, error };
-}
+import type { AppConfig } from "@/lib/types";
 
 export function useJsonData<T>(path: string) {
   const [data, setData] = useState<T | null>(null);
@@ -72,3 +21,55 @@ export function useJsonData<T>(path: string) {
 
   return { data, loading, error };
 }
+
+export type BundleValue = string | number | null;
+export type BundleRow = Record<string, BundleValue>;
+
+interface DictionaryColumn {
+  dictionary: string;
+  codes: (number | null)[];
+}
+
+interface BundleTable {
+  length: number;
+  columns: Record<string, BundleValue[] | DictionaryColumn>;
+}
+
+export interface DataBundle {
+  version: number;
+  generated_at: string;
+  current_gw: number;
+  config: AppConfig;
+  dictionaries: Record<string, string[]>;
+  tables: Record<string, BundleTable>;
+}
+
+export const BUNDLE_VERSION = 1;
+
+export function decodeTable<T>(
+  bundle: DataBundle,
+  name: string,
+  mapRow: (row: BundleRow) => T
+): T[] | null {
+  const table = bundle.tables[name];
+  if (!table) return null;
+  const columns = Object.entries(table.columns).map(([column, values]): [string, BundleValue[]] => {
+    if (Array.isArray(values)) return [column, values];
+    const dictionary = bundle.dictionaries[values.dictionary] ?? [];
+    return [column, values.codes.map((code) => (code === null ? null : dictionary[code]))];
+  });
+  return Array.from({ length: table.length }, (_, i) => {
+    const row: BundleRow = {};
+    columns.forEach(([column, values]) => {
+      row[column] = values[i];
+    });
+    return mapRow(row);
+  });
+}
+
+export function useBundle() {
+  const { data, loading, error } = useJsonData<DataBundle>("/data/bundle.json");
+  const versionError =
+    data && data.version !== BUNDLE_VERSION ? `Unsupported bundle version ${data.version}` : null;
+  return { bundle: versionError ? null : data, loading, error: error ?? versionError };
+}
@@ -0,0 +1,17 @@
+import os
+import duckdb
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(autouse=True)
+def repo_cwd(monkeypatch):
+    # The pipeline reads drafty/sql and drafty/data relative to the repo root
+    monkeypatch.chdir(REPO_DIR)
+
+
+@pytest.fixture
+def con():
+    with duckdb.connect() as con:
+        yield con
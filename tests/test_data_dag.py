@@ -0,0 +1,95 @@
+import os
+from data_dag import Node, run_dag, table_signature
+
+
+def copy_scores(con):
+    con.sql("CREATE OR REPLACE TABLE copied AS SELECT * FROM scores")
+
+
+def copy_scores_twice(con):
+    con.sql(
+        "CREATE OR REPLACE TABLE copied AS SELECT * FROM scores UNION ALL SELECT * FROM scores"
+    )
+
+
+def run_template(con):
+    with open("drafty/sql/scores.sql") as fp:
+        con.sql(f"CREATE OR REPLACE TABLE copied AS {fp.read()}")
+
+
+def statuses(report):
+    return {name: node["status"] for name, node in report.items()}
+
+
+def test_table_signature_counts_duplicate_rows(con):
+    con.sql(
+        "CREATE TABLE scores AS SELECT * FROM (VALUES (1, 'a'), (2, 'b'), (2, 'b')) t(id, name)"
+    )
+    before = table_signature(con, "scores")
+    # Same row count, and the duplicate pairs would cancel out in a xor
+    con.sql("UPDATE scores SET id = 3, name = 'c' WHERE id = 2")
+    assert table_signature(con, "scores") != before
+
+
+def test_unchanged_node_is_skipped(con):
+    con.sql("CREATE TABLE scores AS SELECT 1 AS id")
+    nodes = [Node("copy", copy_scores, inputs=["scores"], outputs=["copied"])]
+    assert statuses(run_dag(con, nodes)) == {"copy": "ran"}
+    assert statuses(run_dag(con, nodes)) == {"copy": "skipped"}
+
+
+def test_changed_code_reruns_node(con):
+    con.sql("CREATE TABLE scores AS SELECT 1 AS id")
+    run_dag(con, [Node("copy", copy_scores, inputs=["scores"], outputs=["copied"])])
+    nodes = [Node("copy", copy_scores_twice, inputs=["scores"], outputs=["copied"])]
+    assert statuses(run_dag(con, nodes)) == {"copy": "ran"}
+    assert con.sql("SELECT count(*) FROM copied").fetchone()[0] == 2
+
+
+def test_changed_template_reruns_node(con, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("drafty/sql")
+    with open("drafty/sql/scores.sql", "w") as fp:
+        fp.write("SELECT 1 AS id")
+    nodes = [Node("template", run_template, inputs=[], outputs=["copied"])]
+    run_dag(con, nodes)
+    assert statuses(run_dag(con, nodes)) == {"template": "skipped"}
+
+    with open("drafty/sql/scores.sql", "w") as fp:
+        fp.write("SELECT 2 AS id")
+    assert statuses(run_dag(con, nodes)) == {"template": "ran"}
+    assert con.sql("SELECT id FROM copied").fetchone()[0] == 2
+
+
+def test_missing_file_output_reruns_node(con, tmp_path):
+    cube = f"{tmp_path}/cube.npy"
+
+    def write_cube(con):
+        con.sql("CREATE OR REPLACE TABLE cube_index AS SELECT 1 AS id")
+        with open(cube, "w") as fp:
+            fp.write("cube")
+
+    nodes = [Node("cube", write_cube, inputs=[], outputs=["cube_index", cube])]
+    run_dag(con, nodes)
+    os.remove(cube)
+    assert statuses(run_dag(con, nodes)) == {"cube": "ran"}
+    assert os.path.exists(cube)
+
+
+def test_changed_helper_module_reruns_node(con, tmp_path, monkeypatch):
+    monkeypatch.syspath_prepend(str(tmp_path))
+    (tmp_path / "dag_helper.py").write_text("ROWS = 1\n")
+    (tmp_path / "dag_transform.py").write_text(
+        "import dag_helper\n\n\n"
+        "def copy(con):\n"
+        "    con.sql(f'CREATE OR REPLACE TABLE copied AS SELECT {dag_helper.ROWS} AS id')\n"
+    )
+    import dag_transform
+
+    nodes = [Node("helper", dag_transform.copy, inputs=[], outputs=["copied"])]
+    run_dag(con, nodes)
+    assert statuses(run_dag(con, nodes)) == {"helper": "skipped"}
+
+    # Only the helper changes, the transform module itself does not
+    (tmp_path / "dag_helper.py").write_text("ROWS = 22\n")
+    assert statuses(run_dag(con, nodes)) == {"helper": "ran"}
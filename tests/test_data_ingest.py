@@ -0,0 +1,177 @@
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import requests
+import data_ingest
+from data_ingest import config_leagues, fetch_batch, get_json, static_requests
+
+
+class StubAPI(BaseHTTPRequestHandler):
+    """
+    Local stand in for the API. Every path answers {"path": path}, except:
+    /status/{code}/{n} fails with code the first n times, /slow sleeps first
+    and /etag answers 304 to a request carrying its ETag.
+    """
+
+    def do_GET(self):
+        api = self.server.api
+        with api["lock"]:
+            api["hits"][self.path] += 1
+            api["times"].append(time.monotonic())
+            api["in_flight"] += 1
+            api["max_in_flight"] = max(api["max_in_flight"], api["in_flight"])
+            hits = api["hits"][self.path]
+        try:
+            parts = self.path.strip("/").split("/")
+            if parts[0] == "slow":
+                time.sleep(0.1)
+            if parts[0] == "status" and hits <= int(parts[2]):
+                self.send_response(int(parts[1]))
+                self.end_headers()
+                return
+            etag = f'"{self.path}"'
+            if parts[0] == "etag" and self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.end_headers()
+                return
+            body = json.dumps({"path": self.path}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            if parts[0] == "etag":
+                self.send_header("ETag", etag)
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            with api["lock"]:
+                api["in_flight"] -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_api(tmp_path, monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubAPI)
+    server.api = {
+        "lock": threading.Lock(),
+        "hits": defaultdict(int),
+        "times": [],
+        "in_flight": 0,
+        "max_in_flight": 0,
+    }
+    thread = threading.Thread(
+        target=server.serve_forever, kwargs={"poll_interval": 0.01}, daemon=True
+    )
+    thread.start()
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(
+        data_ingest,
+        "FETCH_SETTINGS",
+        {
+            **data_ingest.FETCH_SETTINGS,
+            "base_url": f"http://127.0.0.1:{server.server_port}/",
+            "rate_limit": 0,
+            "retries": 3,
+            "backoff": 0.01,
+        },
+    )
+    yield server.api
+    server.shutdown()
+    server.server_close()
+
+
+def fetch(paths, cache_index="http_cache.json"):
+    files = [f"{path.strip('/').replace('/', '_')}.json" for path in paths]
+    apis = [data_ingest.api_url(path.lstrip("/")) for path in paths]
+    return get_json(files, apis, cache_index=cache_index)
+
+
+def test_config_leagues():
+    assert config_leagues({"leagues": [33786, 1234]}) == [33786, 1234]
+    # Configs from before several leagues were supported
+    assert config_leagues({"league_code": 33786}) == [33786]
+
+
+def test_requests_use_the_configured_base_url(stub_api):
+    os.makedirs("drafty/data")
+    assert len(fetch_batch(static_requests())) == 4
+    assert stub_api["hits"]["/bootstrap-static"] == 1
+    with open("drafty/data/event-status.json") as fp:
+        assert json.load(fp) == {"path": "/pl/event-status"}
+
+
+@pytest.mark.parametrize("code", [429, 500, 502, 503, 504])
+def test_retries_rate_limit_and_server_errors(stub_api, code):
+    assert fetch([f"/status/{code}/2"]) == [f"status_{code}_2.json"]
+    assert stub_api["hits"][f"/status/{code}/2"] == 3
+
+
+def test_gives_up_after_retries_with_backoff(stub_api):
+    data_ingest.configure(retries=2, backoff=0.05)
+    start = time.monotonic()
+    with pytest.raises(requests.HTTPError):
+        fetch(["/status/503/5"])
+    assert stub_api["hits"]["/status/503/5"] == 3
+    # Two retries, waiting 0.05s and then 0.1s
+    assert time.monotonic() - start >= 0.15
+
+
+def test_client_errors_are_not_retried(stub_api):
+    with pytest.raises(requests.HTTPError):
+        fetch(["/status/404/1"])
+    assert stub_api["hits"]["/status/404/1"] == 1
+
+
+def test_rate_limit_spaces_requests_to_a_host(stub_api):
+    data_ingest.configure(rate_limit=20, max_workers=4)
+    fetch([f"/item/{i}" for i in range(5)])
+    times = sorted(stub_api["times"])
+    # Four 0.05s intervals; arrival times jitter, so only the span is checked
+    assert times[-1] - times[0] >= 0.15
+
+
+def test_requests_run_concurrently_up_to_max_workers(stub_api):
+    data_ingest.configure(max_workers=4)
+    changed = fetch([f"/slow/{i}" for i in range(8)])
+    assert len(changed) == 8
+    # Each request takes 0.1s, so four of them overlap, but never more
+    assert stub_api["max_in_flight"] == 4
+
+
+def test_not_modified_keeps_and_restores_the_file(stub_api):
+    assert fetch(["/etag/a"]) == ["etag_a.json"]
+    assert fetch(["/etag/a"]) == []
+
+    # A 304 restores a file changed on disk from the cached body
+    with open("etag_a.json", "w") as fp:
+        fp.write("{}")
+    assert fetch(["/etag/a"]) == []
+    with open("etag_a.json") as fp:
+        assert json.load(fp) == {"path": "/etag/a"}
+    assert stub_api["hits"]["/etag/a"] == 3
+
+
+def test_eviction_drops_entries_with_their_bodies(stub_api):
+    # Room for two of the 20 byte bodies
+    data_ingest.configure(cache_max_mb=50 / 1024**2)
+    for name in ["a", "b", "c"]:
+        fetch([f"/etag/{name}"])
+
+    with open("http_cache.json") as fp:
+        entries = json.load(fp)
+    assert sorted(entries) == [data_ingest.api_url(f"etag/{n}") for n in "bc"]
+    assert sorted(os.listdir("http_cache_bodies")) == sorted(
+        f"{entry['body']}.json" for entry in entries.values()
+    )
+    # The evicted url is fetched in full again
+    assert fetch(["/etag/a"]) == ["etag_a.json"]
+
+
+def test_uncached_batches_keep_no_index(stub_api):
+    assert fetch(["/etag/a"], cache_index=None) == ["etag_a.json"]
+    assert fetch(["/etag/a"], cache_index=None) == ["etag_a.json"]
+    assert os.listdir() == ["etag_a.json"]
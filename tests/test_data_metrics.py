@@ -0,0 +1,17 @@
+import data_metrics
+from data_metrics import Stage
+
+
+def test_stage_keeps_query_profile(con, monkeypatch):
+    monkeypatch.setitem(data_metrics.METRICS_SETTINGS, "profile", True)
+    data_metrics.reset()
+    with Stage("transform", "squares", con=con, table="squares"):
+        con.sql("CREATE TABLE squares AS SELECT range * range AS n FROM range(100)")
+
+    (record,) = data_metrics.STAGES
+    assert record["status"] == "ok"
+    assert record["rows"] == 100
+    assert record["profile"]["latency"] >= 0
+    assert record["profile"]["operators"]
+    # Profiling is switched off again after the stage
+    assert not con.sql("SELECT current_setting('enable_profiling')").fetchone()[0]
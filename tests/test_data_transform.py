@@ -0,0 +1,171 @@
+import duckdb
+from data_preprocess import load_gw_event, load_json_to_table
+from data_transform import (
+    calc_blunders,
+    calc_points_index,
+    calc_squads,
+    calc_transfer_horizons,
+    top_n_transfers,
+)
+
+
+def load_league(con, live):
+    """A two team league with transfers in gameweeks 4 to 6, and `live` rows."""
+    con.sql(
+        """
+        CREATE OR REPLACE TABLE elements AS
+        SELECT * FROM (VALUES (1, 'Saka'), (2, 'Palmer'), (3, 'Isak'), (4, 'Watkins'))
+            t(id, web_name)
+        """
+    )
+    con.sql(
+        """
+        CREATE OR REPLACE TABLE league_entries AS
+        SELECT * FROM (VALUES (10, 'Team A'), (20, 'Team B')) t(entry_id, entry_name)
+        """
+    )
+    con.sql(
+        """
+        CREATE OR REPLACE TABLE transactions AS
+        SELECT * FROM (
+            VALUES
+                (1, 10, 4, 'w', 'a', 1, 2),
+                (2, 20, 5, 'f', 'a', 3, 4),
+                (3, 10, 5, 'f', 'r', 2, 1),
+                (4, 10, 6, 'w', 'a', 4, 1)
+        ) t(id, entry, event, kind, result, element_in, element_out)
+        """
+    )
+    con.sql(
+        "CREATE OR REPLACE TABLE gw_live AS "
+        "SELECT * FROM (VALUES "
+        + ", ".join(f"({id}, {gw}, {pts})" for id, gw, pts in live)
+        + ") t(id, gw, total_points)"
+    )
+
+
+def blunders(con):
+    return con.sql("SELECT * FROM blunders ORDER BY ALL").fetchall()
+
+
+def test_incremental_blunders_match_full_rebuild(con):
+    provisional = [(id, gw, gw + id) for id in range(1, 5) for gw in range(1, 7)]
+    load_league(con, provisional)
+    calc_blunders(con)
+
+    # Gameweek 6 is live on the first run, with its waivers already processed,
+    # and finishes with different points
+    final = [(id, gw, pts + 10 * (gw == 6)) for id, gw, pts in provisional]
+    load_league(con, final)
+    calc_blunders(con, incremental=True)
+
+    with duckdb.connect() as full:
+        load_league(full, final)
+        calc_blunders(full)
+        assert blunders(con) == blunders(full)
+
+    # The gameweek 5 transfer is scored on the final gameweek 6 points
+    assert con.sql(
+        "SELECT player_in_pts, player_out_pts FROM blunders WHERE gw = 5"
+    ).fetchall() == [(19, 20)]
+
+
+def test_blunders_rank_ties_by_transaction(con):
+    # Every transfer nets 0 points in the same gameweek, so only the
+    # transaction id can order them
+    load_league(con, [(id, gw, 1) for id in range(1, 5) for gw in range(1, 7)])
+    con.sql(
+        """
+        CREATE OR REPLACE TABLE transactions AS
+        SELECT id, 10 AS entry, 4 AS event, 'f' AS kind, 'a' AS result,
+            1 + id % 4 AS element_in, 1 + (id + 1) % 4 AS element_out
+        FROM (VALUES (7), (3), (9), (5)) t(id)
+        """
+    )
+    calc_blunders(con)
+    top_n_transfers(con, k=10)
+    for rank in ["best_rank", "worst_rank"]:
+        assert con.sql(
+            f"SELECT transaction_id FROM transfer_ranks ORDER BY {rank}"
+        ).fetchall() == [(3,), (5,), (7,), (9,)]
+
+
+def test_incremental_rebuilds_a_table_with_old_columns(con):
+    load_league(con, [(id, gw, gw + id) for id in range(1, 5) for gw in range(1, 7)])
+    calc_blunders(con)
+    con.sql("ALTER TABLE blunders DROP COLUMN transaction_id")
+    calc_blunders(con, incremental=True)
+    assert con.sql("SELECT count(transaction_id) FROM blunders").fetchone()[0] == 3
+
+
+def test_held_horizon_counts_gameweeks_in_squad(con):
+    load_league(con, [(id, gw, gw + id) for id in range(1, 5) for gw in range(1, 7)])
+    calc_points_index(con)
+    calc_transfer_horizons(con, horizons=[1, 3])
+
+    held = con.sql(
+        """
+        SELECT player_in, next_gw, last_gw, player_in_pts, player_out_pts
+        FROM transfer_horizons
+        WHERE horizon = 'held'
+        ORDER BY gw
+        """
+    ).fetchall()
+    assert held == [
+        # Saka is in the squad in gameweeks 4 and 5, dropped in gameweek 6
+        ("Saka", 4, 5, 5 + 6, 6 + 7),
+        ("Isak", 5, 6, 8 + 9, 9 + 10),
+        ("Watkins", 6, 6, 10, 7),
+    ]
+
+    # Every horizon starts at the transfer gameweek and stops before the drop
+    windows = con.sql(
+        """
+        SELECT horizon, player_in, next_gw, last_gw
+        FROM transfer_horizons
+        WHERE horizon != 'held'
+        ORDER BY horizon, gw
+        """
+    ).fetchall()
+    assert windows == [
+        ("1", "Saka", 4, 4),
+        ("1", "Isak", 5, 5),
+        ("1", "Watkins", 6, 6),
+        # Saka is dropped in gameweek 6, the season ends in gameweek 6
+        ("3", "Saka", 4, 5),
+        ("3", "Isak", 5, 6),
+        ("3", "Watkins", 6, 6),
+    ]
+
+
+def test_squads_differ_from_picks_only_by_the_gw4_trade(con):
+    league_dir = "drafty/data/league_33786"
+    files = {
+        f"{league_dir}/details.json": ["league_entries"],
+        f"{league_dir}/choices.json": ["choices"],
+        f"{league_dir}/transactions.json": ["transactions"],
+        "drafty/data/event-status.json": ["status"],
+    }
+    for file_path, keys in files.items():
+        load_json_to_table(con=con, file_path=file_path, keys=keys)
+    entries = [
+        row[0] for row in con.sql("SELECT entry_id FROM league_entries").fetchall()
+    ]
+    load_gw_event(con=con, entries=entries, data_dir=league_dir)
+    calc_squads(con)
+
+    mismatches = con.sql(
+        """
+        SELECT team_id, element, only_in, min(gw), max(gw), count(*)
+        FROM squad_mismatches
+        GROUP BY ALL
+        ORDER BY ALL
+        """
+    ).fetchall()
+    # Two teams traded 64 for 666 before gameweek 4, which neither log has
+    assert mismatches == [
+        (167712, 64, "log", 4, 9, 6),
+        (167712, 666, "picks", 4, 9, 6),
+        (167713, 64, "picks", 4, 9, 6),
+        (167713, 666, "log", 4, 9, 6),
+    ]
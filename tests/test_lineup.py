@@ -0,0 +1,113 @@
+import itertools
+import numpy as np
+from lineup import FORMATIONS, autosubs, optimal_points, squad_arrays
+from stat_cube import build_stat_cube
+
+# A 4-4-2 starting 11, then the bench GK and three outfield players
+TYPES_442 = [1, 2, 2, 2, 2, 3, 3, 3, 3, 4, 4, 1, 2, 3, 4]
+
+
+def replaced_by(element_type, minutes):
+    """Bench slot replacing each starter of one squad, see autosubs."""
+    return autosubs(np.array([element_type]), np.array([minutes]))[0].tolist()
+
+
+def test_goalkeeper_is_only_replaced_by_the_bench_goalkeeper():
+    # The bench GK played, so they replace the GK who did not
+    minutes = [0] + [90] * 14
+    assert replaced_by(TYPES_442, minutes)[0] == 11
+
+    # The outfield bench players played, but none of them can go in goal
+    minutes = [0] + [90] * 10 + [0, 90, 90, 90]
+    assert replaced_by(TYPES_442, minutes) == [-1] * 15
+
+    # Nor can the bench GK replace an outfield starter
+    minutes = [90] * 10 + [0, 90, 0, 0, 0]
+    assert replaced_by(TYPES_442, minutes) == [-1] * 15
+
+
+def test_formation_minimum_blocks_an_outfield_sub():
+    # A 3-5-2 loses a defender: the bench MID and FWD would leave 2 defenders,
+    # so the last bench player, a defender, comes on
+    element_type = [1, 2, 2, 2, 3, 3, 3, 3, 3, 4, 4, 1, 3, 4, 2]
+    minutes = [90, 0] + [90] * 13
+    assert replaced_by(element_type, minutes) == [-1, 14] + [-1] * 13
+
+
+def test_subs_come_on_in_bench_order():
+    # Both bench players who played come on in bench order, skipping the
+    # bench defender who did not play
+    minutes = [90] * 5 + [0] + [90] * 3 + [0] + [90] * 2 + [0] + [90] * 2
+    assert replaced_by(TYPES_442, minutes) == (
+        [-1] * 5 + [13] + [-1] * 3 + [14] + [-1] * 5
+    )
+
+
+def test_squad_arrays_undo_the_applied_subs(con, tmp_path):
+    # Elements 1 to 15 have the types of TYPES_442, element 3 did not play
+    con.sql(
+        f"""
+        CREATE TABLE elements AS
+        SELECT unnest(range(1, 16)) AS id, unnest({TYPES_442}) AS element_type
+        """
+    )
+    con.sql(
+        """
+        CREATE TABLE gw_live AS
+        SELECT id, 1 AS gw, CASE WHEN id = 3 THEN 0 ELSE 90 END AS minutes,
+            CASE WHEN id = 3 THEN 0 ELSE id END AS total_points
+        FROM elements
+        """
+    )
+    # The game brought the bench DEF, element 13, on for element 3 and
+    # swapped their positions
+    con.sql(
+        """
+        CREATE TABLE gw_event AS
+        SELECT id AS element,
+            CASE id WHEN 3 THEN 13 WHEN 13 THEN 3 ELSE id END AS position,
+            1 AS gw, 10 AS team_id
+        FROM elements
+        """
+    )
+    con.sql(
+        "CREATE TABLE gw_subs AS SELECT 13 AS element_in, 3 AS element_out, "
+        "1 AS gw, 10 AS team_id"
+    )
+    build_stat_cube(con, cube_dir=str(tmp_path))
+
+    squads = squad_arrays(con, str(tmp_path))
+    assert squads["element"].tolist() == [list(range(1, 16))]
+    assert squads["minutes"][0, 2] == 0
+    assert squads["points"][0, 12] == 13
+    # Replaying the autosubs brings element 13 on for element 3 again
+    assert autosubs(squads["element_type"], squads["minutes"])[0, 2] == 12
+
+
+def brute_force_points(element_type, points, formations=FORMATIONS):
+    """Best points of one squad over every 11 of it in one of formations."""
+    best = -np.inf
+    for xi in itertools.combinations(range(15), 11):
+        counts = tuple(np.bincount(element_type[list(xi)], minlength=5)[1:])
+        if counts in formations:
+            best = max(best, points[list(xi)].sum())
+    return best
+
+
+def test_optimal_points_match_brute_force():
+    # 3 to 5 DEF, 2 to 5 MID and 1 to 3 FWD adding up to 10 outfield starters
+    assert len(FORMATIONS) == 8
+    rng = np.random.default_rng(0)
+    # Squads of 2 GK, 5 DEF, 5 MID and 3 FWD in random order
+    element_type = np.array(
+        [rng.permutation([1] * 2 + [2] * 5 + [3] * 5 + [4] * 3) for _ in range(40)]
+    )
+    points = rng.integers(-3, 16, size=element_type.shape)
+
+    best, formation = optimal_points(element_type, points)
+    for squad in range(len(points)):
+        assert best[squad] == brute_force_points(element_type[squad], points[squad])
+        # The formation returned is one that reaches the best points
+        assert best[squad] == brute_force_points(
+            element_type[squad], points[squad], [FORMATIONS[formation[squad]]]
+        )
@@ -0,0 +1,73 @@
+import os
+import numpy as np
+from stat_cube import StatCube, build_stat_cube
+
+
+def load_live(con, xg):
+    """Live stats of 3 players over 3 gameweeks, player 2 missing in gameweek 2."""
+    con.sql("CREATE OR REPLACE TABLE elements AS SELECT unnest([1, 2, 3, 4]) AS id")
+    con.sql(
+        f"""
+        CREATE OR REPLACE TABLE gw_live AS
+        SELECT
+            id,
+            gw,
+            (id * 10 + gw)::INTEGER AS total_points,
+            (id * gw * {xg})::DOUBLE AS expected_goals,
+            'x' AS name
+        FROM range(1, 4) i(id), range(1, 4) g(gw)
+        WHERE NOT (id = 2 AND gw = 2)
+        """
+    )
+
+
+def test_cube_round_trips_gw_live(con, tmp_path):
+    load_live(con, xg=0.37)
+    build_stat_cube(con, cube_dir=str(tmp_path))
+    cube = StatCube.load(str(tmp_path))
+
+    # Text columns are left out, DOUBLE ones kept as float32
+    assert cube.stats == ["total_points", "expected_goals"]
+    assert cube.data.dtype == np.float32
+    assert cube.gameweeks == 3
+    live = con.sql("SELECT id, gw, total_points, expected_goals FROM gw_live")
+    for id, gw, points, xg in live.fetchall():
+        row = cube.rows([id])[0]
+        assert cube.stat("total_points")[row, gw - 1] == points
+        assert cube.stat("expected_goals")[row, gw - 1] == np.float32(xg)
+    # Missing from gw_live counts as 0, for players without any stats too
+    assert cube.stat("expected_goals")[cube.rows([2])[0], 1] == 0
+    assert not cube.data[cube.rows([4])[0]].any()
+    assert con.sql("SELECT id, row FROM stat_cube_index ORDER BY id").fetchall() == [
+        (1, 0),
+        (2, 1),
+        (3, 2),
+        (4, 3),
+    ]
+
+
+def test_rebuild_swaps_the_cube_in_one_step(con, tmp_path):
+    cube_dir = str(tmp_path)
+    load_live(con, xg=0.1)
+    build_stat_cube(con, cube_dir=cube_dir)
+    first = StatCube.load(cube_dir)
+    first_version = StatCube.version(cube_dir)
+
+    load_live(con, xg=0.2)
+    build_stat_cube(con, cube_dir=cube_dir)
+    second_version = StatCube.version(cube_dir)
+    assert second_version != first_version
+    # A reader of the old version still sees the old cube in full
+    assert first.stat("expected_goals")[0, 0] == np.float32(0.1)
+    assert StatCube.load(cube_dir).stat("expected_goals")[0, 0] == np.float32(0.2)
+
+    # The same contents are the same version, and only the current and the
+    # previous version are kept
+    load_live(con, xg=0.3)
+    build_stat_cube(con, cube_dir=cube_dir)
+    assert sorted(os.listdir(cube_dir)) == sorted(
+        ["current", second_version, StatCube.version(cube_dir)]
+    )
+    load_live(con, xg=0.3)
+    build_stat_cube(con, cube_dir=cube_dir)
+    assert len(os.listdir(cube_dir)) == 3